@@ -0,0 +1,155 @@
+"""
+Кэш результатов запросов с вытеснением LRU, временем жизни записей
+и приблизительным учетом занимаемой памяти
+"""
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+
+def key_label(key):
+    """Имя функции из ключа кэша - для логов (аргументы могут содержать токены)"""
+    return str(key).split(":", 1)[0]
+
+
+def approx_size(obj, _seen=None):
+    """Приблизительно оценивает размер объекта в байтах вместе с вложенными объектами"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += approx_size(key, _seen) + approx_size(value, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += approx_size(item, _seen)
+    return size
+
+
+class CacheEngine:
+    """
+    Кэш с вытеснением давно не использованных записей (LRU).
+
+    Каждая запись хранит данные, время создания и время жизни. Общий размер
+    записей не превышает max_bytes: при переполнении вытесняются записи,
+    к которым дольше всего не обращались. Устаревшие записи не удаляются
+    при чтении, чтобы их можно было отдать, пока идет обновление.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def is_fresh(self, entry, now=None):
+        """Проверяет, не истекло ли время жизни записи"""
+        now = time.time() if now is None else now
+        return now - entry["time"] < entry["ttl"]
+
+    def get(self, key):
+        """
+        Возвращает запись {"data", "time", "ttl", "size"} или None и отмечает обращение к ней
+
+        Устаревшая запись тоже возвращается - решение о ее использовании принимает вызывающий
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if self.is_fresh(entry):
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return entry
+
+    def set(self, key, data, timestamp=None, ttl=None):
+        """Сохраняет данные в кэш, при необходимости вытесняя старые записи"""
+        size = approx_size(data)
+        if size > self.max_bytes:
+            # Запись больше всего бюджета - не кэшируем ее, чтобы не вытеснить все остальное
+            self.rejected += 1
+            logger.warning(f"Запись {key_label(key)} ({size // 1024} КБ) превышает бюджет кэша и не сохранена")
+            self.pop(key)
+            return
+
+        self.pop(key)
+        self._entries[key] = {
+            "data": data,
+            "time": time.time() if timestamp is None else timestamp,
+            "ttl": self.ttl if ttl is None else ttl,
+            "size": size
+        }
+        self.total_bytes += size
+        self._evict()
+
+    def pop(self, key):
+        """Удаляет запись из кэша и возвращает ее (или None)"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry["size"]
+        return entry
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry["size"]
+            self.evictions += 1
+            logger.info(f"Запись {key_label(key)} вытеснена из кэша ({entry['size'] // 1024} КБ)")
+
+    def items(self):
+        """Возвращает список пар (ключ, запись) без изменения порядка вытеснения"""
+        return list(self._entries.items())
+
+    def remove_older_than(self, max_age):
+        """Удаляет записи старше max_age секунд и возвращает их количество"""
+        now = time.time()
+        keys = [key for key, entry in self._entries.items() if now - entry["time"] > max_age]
+        for key in keys:
+            self.pop(key)
+        return len(keys)
+
+    def dump(self):
+        """Возвращает содержимое кэша для сохранения в снимок"""
+        return {key: {"data": entry["data"], "time": entry["time"]} for key, entry in self._entries.items()}
+
+    def load(self, entries):
+        """Загружает записи из снимка (в формате dump)"""
+        for key, entry in entries.items():
+            self.set(key, entry["data"], timestamp=entry["time"])
+
+    def stats(self):
+        """Возвращает счетчики кэша"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,82 @@
+"""
+Запуск бота в кластерном режиме
+
+Запускает один процесс обновления каталога (BOT_ROLE=refresher) и несколько
+обработчиков обновлений Telegram (BOT_ROLE=worker). Процесс обновления загружает
+данные из ВК и публикует снимок каталога на диске, обработчики принимают webhook
+на общем порту и перечитывают снимок при появлении новой версии.
+Упавшие процессы перезапускаются.
+
+Использование:
+    python cluster.py
+"""
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import config
+
+# Настройка логгера
+logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT, datefmt=config.LOG_DATE_FORMAT)
+logger = logging.getLogger(__name__)
+
+# Пауза перед перезапуском упавшего процесса в секундах
+RESTART_DELAY = 5
+
+running = True
+
+
+def spawn(role, index, workers_count):
+    """Запускает main.py в указанной роли; index - номер обработчика, workers_count - число обработчиков (делят лимит Telegram)"""
+    env = dict(os.environ, BOT_ROLE=role, BOT_MODE="webhook", WORKER_INDEX=str(index), CLUSTER_WORKERS=str(workers_count))
+    process = subprocess.Popen([sys.executable, "main.py"], env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    logger.info(f"Запущен процесс {role} #{index} (PID: {process.pid})")
+    return process
+
+
+def stop(signum, frame):
+    global running
+    running = False
+
+
+def main():
+    if not config.CACHE_SNAPSHOT_ENABLED:
+        logger.error("Кластерный режим требует CACHE_SNAPSHOT_ENABLED = True")
+        return 1
+    if not config.FSM_STORAGE_PATH:
+        logger.error("Кластерный режим требует общего хранилища состояний (FSM_STORAGE_PATH)")
+        return 1
+
+    workers_count = config.CLUSTER_WORKERS or os.cpu_count() or 1
+    logger.info(f"Запуск кластера: 1 процесс обновления и {workers_count} обработчиков")
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    roles = [("refresher", 0)] + [("worker", index) for index in range(workers_count)]
+    processes = [spawn(role, index, workers_count) for role, index in roles]
+
+    while running:
+        time.sleep(1)
+        for i, process in enumerate(processes):
+            if process.poll() is not None and running:
+                logger.warning(f"Процесс {roles[i][0]} #{roles[i][1]} (PID: {process.pid}) завершился с кодом {process.returncode}, перезапуск через {RESTART_DELAY} сек")
+                time.sleep(RESTART_DELAY)
+                processes[i] = spawn(*roles[i], workers_count)
+
+    logger.info("Остановка кластера...")
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
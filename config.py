@@ -34,18 +34,81 @@ TELEGRAM_API_HASH = '7ec8158285a1d583eaea1d881c70ca2e'
 # Настройки бота
 ADMIN_IDS = os.getenv('ADMIN_IDS', '')  # Список ID администраторов через запятую
 
+# Режим получения обновлений: 'polling' (long polling) или 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Настройки webhook (используются при BOT_MODE=webhook)
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '')  # Публичный адрес, например https://bot.example.com (пусто - webhook в Telegram не регистрируется)
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')  # Путь, на который Telegram отправляет обновления
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (символы A-Z, a-z, 0-9, _ и -)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))  # Максимум одновременных соединений Telegram (1-100)
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '0'))  # Размер очереди обновлений (0 - обрабатывать прямо в запросе)
+WEBHOOK_QUEUE_WORKERS = int(os.getenv('WEBHOOK_QUEUE_WORKERS', '4'))  # Количество обработчиков очереди обновлений
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')  # Адрес локального веб-сервера
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))  # Порт локального веб-сервера
+
+# Роль процесса: 'single' (один экземпляр), 'refresher' (обновляет каталог из ВК и публикует снимок)
+# или 'worker' (обрабатывает обновления Telegram, читая опубликованный снимок). Процессы запускает cluster.py
+BOT_ROLE = os.getenv('BOT_ROLE', 'single')
+CLUSTER_WORKERS = int(os.getenv('CLUSTER_WORKERS', '0'))  # Количество обработчиков в кластере (0 - по числу ядер)
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', '0'))  # Номер обработчика в кластере (задается cluster.py)
+SNAPSHOT_POLL_INTERVAL = 5  # Интервал проверки нового снимка каталога обработчиками в секундах
+
 # Настройки кэширования
 CACHE_TIME = 7200  # Время жизни кэша в секундах (2 часа)
 CACHE_CLEANUP_INTERVAL = 1800  # Интервал очистки кэша в секундах (30 минут)
 MAX_MEMORY_USAGE_MB = 512  # Максимальное использование памяти в МБ
+CACHE_MEMORY_SHARE = 0.5  # Доля MAX_MEMORY_USAGE_MB, которую может занимать кэш результатов запросов
+INCREMENTAL_UPDATE_ENABLED = True  # Инкрементально обновлять базу мастеров между полными обновлениями
+INCREMENTAL_UPDATE_INTERVAL = 900  # Интервал инкрементального обновления в секундах (15 минут)
+LAZY_MASTER_WORKS = True  # Загружать работы мастеров при первом просмотре, а не при прогреве
+if BOT_ROLE in ('refresher', 'worker'):
+    # Обработчики кластера не обращаются к ВК, поэтому работы заранее загружает процесс обновления
+    LAZY_MASTER_WORKS = False
+LAZY_WORKS_PREFETCH = 1  # Сколько соседних мастеров карусели предзагружать в ленивом режиме (0 - не предзагружать)
+MASTER_WORKS_GALLERY = True  # Показывать работы мастера альбомами по MEDIA_GROUP_SIZE фото (иначе - по одной с пролистыванием)
+FSM_STORAGE_PATH = os.getenv('FSM_STORAGE_PATH', os.path.join('data', 'fsm.sqlite3'))  # База состояний пользователей (пусто - хранить в памяти)
+CACHE_SNAPSHOT_ENABLED = True  # Сохранять снимок кэша на диск для быстрого перезапуска
+FILE_ID_CACHE_PATH = os.getenv('FILE_ID_CACHE_PATH', os.path.join('data', 'file_ids.json'))  # Путь к кэшу file_id фотографий Telegram
+if BOT_ROLE == 'worker':
+    # У каждого обработчика кластера свой файл, чтобы процессы не перезаписывали file_id друг друга
+    _file_id_root, _file_id_ext = os.path.splitext(FILE_ID_CACHE_PATH)
+    FILE_ID_CACHE_PATH = f"{_file_id_root}.worker{WORKER_INDEX}{_file_id_ext}"
+CACHE_SNAPSHOT_PATH = os.getenv('CACHE_SNAPSHOT_PATH', os.path.join('data', 'cache_snapshot.json.gz'))  # Путь к снимку кэша
 
 # API ограничения и задержки
+TG_GLOBAL_RATE_LIMIT = 30  # Максимум сообщений Telegram в секунду от бота
+if BOT_ROLE == 'worker' and CLUSTER_WORKERS > 0:
+    # Лимит Telegram общий для бота, поэтому обработчики кластера делят его поровну
+    TG_GLOBAL_RATE_LIMIT = TG_GLOBAL_RATE_LIMIT / CLUSTER_WORKERS
+TG_CHAT_RATE_LIMIT = 1  # Сообщений в секунду в один чат
+TG_CHAT_BURST = 3  # Сколько сообщений подряд можно отправить в чат без ожидания
+TG_SEND_MAX_RETRIES = 3  # Повторов отправки после ошибки RetryAfter
+MEDIA_GROUP_SIZE = 10  # Фото в одном альбоме sendMediaGroup (ограничение Telegram)
+MARKET_MEDIA_GROUPS = True  # Показывать товары маркета альбомами с кнопкой "Показать ещё" (иначе - по одному сообщению)
+CAPTION_LIMIT = 1024  # Максимальная длина подписи к фото в Telegram
 API_RATE_LIMIT = 20  # Максимальное количество запросов в секунду
 API_RATE_LIMIT_INTERVAL = 0.05  # Минимальный интервал между запросами (50 мс)
+VK_TOKEN_TYPE = os.getenv('VK_TOKEN_TYPE', 'user')  # Тип токена ВК: 'user' или 'group'
+VK_USER_TOKEN_RPS = 3  # Лимит ВК для пользовательского токена (запросов в секунду)
+VK_GROUP_TOKEN_RPS = API_RATE_LIMIT  # Лимит ВК для токена сообщества (запросов в секунду)
+VK_METHOD_RATE_LIMITS = {}  # Дополнительные лимиты отдельных методов, например {'execute': 1}
 API_MAX_RETRIES = 3  # Максимальное количество повторных попыток запроса
+VK_PARSE_THREADS = 4  # Количество потоков для разбора ответов ВКонтакте
+SHOP_PARSE_PROCESSES = 2  # Количество процессов для разбора каталога магазинов (0 - разбирать в потоке)
+VK_API_VERSION = '5.131'  # Версия API ВКонтакте для асинхронного клиента
+VK_HTTP_CONNECTION_LIMIT = 20  # Общий лимит соединений асинхронного клиента ВК
+VK_HTTP_CONNECTION_LIMIT_PER_HOST = 10  # Лимит соединений к одному хосту (api.vk.com)
+VK_HTTP_TIMEOUT = 30  # Таймаут запроса к API ВКонтакте (сек)
+VK_RETRY_BACKOFF = 0.5  # Базовая задержка повтора при ошибках ВК 6/9/10 (сек), растет экспоненциально
 
 # Настройки оптимизации запросов
 BATCH_SIZE = 100  # Размер пакета для групповых запросов
+MARKET_PAGE_SIZE = 200  # Количество товаров на странице market.get (ограничение ВК)
+PHOTOS_PAGE_SIZE = 1000  # Количество фото на странице photos.get (ограничение ВК)
+PHOTO_PAGES_CACHE_SIZE = 50  # Максимум страниц фото альбомов мастеров в кэше для инкрементального обновления
+VK_EXECUTE_BATCH_SIZE = 25  # Количество вызовов API в одном запросе execute (ограничение ВК)
+PRELOAD_CONCURRENCY = 0  # Одновременных запросов к ВК при загрузке базы мастеров (0 - по лимиту токена)
 PRELOAD_CRITICAL_DATA_ONLY = True  # Загружать только критически важные данные при старте
 ASYNC_DATA_LOADING = True  # Асинхронная загрузка данных в фоне
 
@@ -0,0 +1,197 @@
+"""
+Кэш file_id фотографий Telegram
+
+Фото из ВКонтакте отправляется по URL только один раз: из ответа Telegram
+запоминается file_id, и при следующих показах отправляется уже он.
+Ключом служит URL фото в ВК, поэтому при смене URL фото загружается заново.
+"""
+import json
+import logging
+import os
+from aiogram import types
+from aiogram.utils import exceptions
+import config
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+# Фрагменты текста ошибок Telegram, означающих, что file_id больше недействителен
+WRONG_FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "file reference expired")
+
+
+class FileIdCache:
+    """Соответствие URL фото в ВК и file_id в Telegram с сохранением на диск"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file_ids = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._file_ids)
+
+    def get(self, url):
+        """Возвращает file_id для URL или None"""
+        file_id = self._file_ids.get(url)
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+
+    def remember(self, url, message):
+        """Запоминает file_id самого большого размера фото из отправленного сообщения"""
+        if not url or not isinstance(message, types.Message) or not message.photo:
+            return
+        file_id = message.photo[-1].file_id
+        if self._file_ids.get(url) != file_id:
+            self._file_ids[url] = file_id
+            self._dirty = True
+
+    def forget(self, url):
+        """Удаляет file_id для URL (например, если Telegram его больше не принимает)"""
+        if self._file_ids.pop(url, None) is not None:
+            self._dirty = True
+
+    def prune(self, valid_urls):
+        """Удаляет file_id для URL, которых больше нет в данных из ВК. Возвращает число удаленных"""
+        stale = [url for url in self._file_ids if url not in valid_urls]
+        for url in stale:
+            del self._file_ids[url]
+        if stale:
+            self._dirty = True
+        return len(stale)
+
+    def load(self):
+        """Загружает сохраненные file_id с диска"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._file_ids = json.load(f)
+            logger.info(f"Загружено {len(self._file_ids)} file_id фотографий")
+        except Exception as e:
+            logger.error(f"Не удалось прочитать кэш file_id {self.path}: {e}")
+            self._file_ids = {}
+
+    def take_changes(self):
+        """
+        Возвращает копию file_id для записи на диск и сбрасывает признак изменений
+
+        Копия снимается в цикле событий, поэтому запись в отдельном потоке
+        не видит изменений словаря, а file_id, запомненные во время записи,
+        попадут в следующее сохранение. Если изменений нет, возвращает None.
+        """
+        if not self._dirty:
+            return None
+        self._dirty = False
+        return dict(self._file_ids)
+
+    def write(self, data):
+        """Атомарно записывает копию file_id на диск (можно вызывать в отдельном потоке)"""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            # Изменения не записаны - сохраним их в следующий раз
+            self._dirty = True
+            raise
+
+    def save(self):
+        """Атомарно сохраняет file_id на диск, если были изменения"""
+        data = self.take_changes()
+        if data is not None:
+            self.write(data)
+
+    def stats(self):
+        return {"size": len(self._file_ids), "hits": self.hits, "misses": self.misses}
+
+
+def is_wrong_file_id_error(error):
+    """Проверяет, что ошибка Telegram означает недействительный file_id"""
+    message = str(error).lower()
+    return any(text in message for text in WRONG_FILE_ID_ERRORS)
+
+
+def collect_photo_urls(data, urls=None):
+    """Собирает все URL фото (значения ключей "url" и "photo") из вложенных данных кэша"""
+    if urls is None:
+        urls = set()
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in ("url", "photo") and isinstance(value, str):
+                urls.add(value)
+            else:
+                collect_photo_urls(value, urls)
+    elif isinstance(data, (list, tuple)):
+        for item in data:
+            collect_photo_urls(item, urls)
+    return urls
+
+
+file_ids = FileIdCache(config.FILE_ID_CACHE_PATH)
+
+
+async def send_cached_photo(send, url):
+    """
+    Отправляет фото через send(photo), подставляя сохраненный file_id вместо URL
+
+    Args:
+        send: функция, которая принимает file_id или URL и возвращает корутину отправки
+        url: URL фото в ВКонтакте
+
+    Returns:
+        Результат send
+    """
+    file_id = file_ids.get(url) if url else None
+    if file_id:
+        try:
+            return await send(file_id)
+        except exceptions.BadRequest as e:
+            if not is_wrong_file_id_error(e):
+                raise
+            logger.warning(f"Сохраненный file_id для {url} недействителен, отправляем по URL")
+            file_ids.forget(url)
+
+    result = await send(url)
+    file_ids.remember(url, result)
+    return result
+
+
+async def send_cached_media_group(send, urls):
+    """
+    Отправляет альбом фото через send(media), подставляя сохраненные file_id вместо URL
+
+    Args:
+        send: функция, которая принимает список file_id или URL и возвращает корутину отправки
+        urls: URL фото в ВКонтакте в порядке альбома
+
+    Returns:
+        Список отправленных сообщений
+    """
+    refs = [file_ids.get(url) or url for url in urls]
+    if refs != list(urls):
+        try:
+            messages = await send(refs)
+        except exceptions.BadRequest as e:
+            if not is_wrong_file_id_error(e):
+                raise
+            logger.warning("Сохраненные file_id альбома недействительны, отправляем по URL")
+            for url, ref in zip(urls, refs):
+                if ref != url:
+                    file_ids.forget(url)
+            messages = await send(list(urls))
+    else:
+        messages = await send(list(urls))
+
+    for url, message in zip(urls, messages or []):
+        file_ids.remember(url, message)
+    return messages
@@ -6,13 +6,19 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
 from tg_bot.states import User
 from tg_bot import buttons
+from tg_bot.name_index import NameIndexCache
+from tg_bot.router import Router
 import vk
-from vk import get_topic_info_async, get_topic_comments_async
+import vk_async
+import snapshot
+import webhook
+from cache_engine import CacheEngine
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from tg_bot.storage import SQLiteStorage
 import asyncio
+import contextlib
 import config
 import time
-from datetime import datetime
 from aiogram.utils import exceptions
 import os
 import sys
@@ -21,6 +27,7 @@ import tempfile
 import psutil
 import re
 import json
+import hashlib
 import pytz
 import vk_api
 from vk_api.keyboard import VkKeyboard, VkKeyboardColor
@@ -29,6 +36,8 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils.executor import start_polling
 from message_utils import add_links_footer, send_message_with_links, edit_message_with_links, send_photo_with_links
+from file_id_cache import file_ids, send_cached_photo, send_cached_media_group, collect_photo_urls
+from send_scheduler import ScheduledBot, bulk_sends
 
 # Настройка логирования
 if config.LOG_TO_FILE:
@@ -130,17 +139,32 @@ def release_lock():
         logger.error(f"Ошибка при освобождении блокировки: {e}")
 
 # Инициализация бота и диспетчера
-bot = Bot(token=config.TG_BOT_TOKEN)
-storage = MemoryStorage()
+# Сообщения отправляются через планировщик с учетом лимитов Telegram
+bot = ScheduledBot(token=config.TG_BOT_TOKEN)
+# Состояния пользователей хранятся в SQLite и переживают перезапуск бота
+# (обработчики кластера делят одну базу, поэтому не кэшируют записи в памяти)
+storage = (SQLiteStorage(config.FSM_STORAGE_PATH, cache_records=config.BOT_ROLE != 'worker')
+           if config.FSM_STORAGE_PATH else MemoryStorage())
 dp = Dispatcher(bot, storage=storage)
 
-# Добавляем кэш для хранения данных
-cache = {}
+# Тексты кнопок и callback data выбирают обработчик по таблицам маршрутов,
+# а не перебором фильтров (команды по-прежнему обрабатывает диспетчер)
+router = Router()
+router.setup(dp)
+
+# Добавляем кэш для хранения данных (LRU с ограничением по памяти)
+cache = CacheEngine(
+    max_bytes=int(config.MAX_MEMORY_USAGE_MB * config.CACHE_MEMORY_SHARE * 1024 * 1024),
+    ttl=config.CACHE_TIME
+)
 
 # Добавляем кэш для непустых категорий мастеров
 non_empty_masters_cache = {}
 non_empty_masters_cache_time = 0
 
+# Индексы названий категорий и магазинов (перестраиваются после обновления каталогов)
+name_indexes = NameIndexCache()
+
 # Добавляем кэш для магазинов
 shops_categories_cache = {}
 shops_categories_cache_time = 0
@@ -148,40 +172,13 @@ shops_categories_cache_time = 0
 # Интервал обновления кэша в секундах (2 часа)
 CACHE_UPDATE_INTERVAL = 7200
 
-# Добавляем лимитер запросов к ВК API
-vk_api_semaphore = asyncio.Semaphore(config.API_RATE_LIMIT)  # Используем лимит из конфига
-vk_api_last_request_time = {}  # Словарь для отслеживания времени последнего запроса для каждого метода
-
-async def vk_api_rate_limit():
-    """Функция для ограничения частоты запросов к API ВКонтакте"""
-    async with vk_api_semaphore:
-        # Гарантируем, что между запросами к ВК API будет минимальная пауза
-        current_time = datetime.now()
-        method_key = "global"  # Используем глобальный ключ для всех запросов
-        
-        if method_key in vk_api_last_request_time:
-            time_since_last_request = (current_time - vk_api_last_request_time[method_key]).total_seconds()
-            if time_since_last_request < config.API_RATE_LIMIT_INTERVAL:  # Используем интервал из конфига
-                await asyncio.sleep(config.API_RATE_LIMIT_INTERVAL - time_since_last_request)
-        
-        # Обновляем время последнего запроса
-        vk_api_last_request_time[method_key] = datetime.now()
-
 # Добавляем дополнительные оптимизации для кэша
 def clear_old_cache_entries():
     """Очищает устаревшие записи в кэше для освобождения памяти"""
-    current_time = time.time()
-    keys_to_remove = []
-    
-    for key, cache_entry in cache.items():
-        if current_time - cache_entry["time"] > config.CACHE_TIME * 2:
-            keys_to_remove.append(key)
-    
-    for key in keys_to_remove:
-        del cache[key]
+    removed = cache.remove_older_than(config.CACHE_TIME * 2)
     
-    if keys_to_remove:
-        logger.info(f"Очищено {len(keys_to_remove)} устаревших записей из кэша")
+    if removed:
+        logger.info(f"Очищено {removed} устаревших записей из кэша")
 
 # Периодическая очистка кэша каждые 30 минут
 async def periodic_cache_cleanup():
@@ -195,11 +192,109 @@ async def periodic_cache_cleanup():
         memory_usage = process.memory_info().rss / 1024 / 1024  # В МБ
         logger.info(f"Текущее использование памяти: {memory_usage:.2f} МБ")
 
-# Периодическое обновление кэша каждые 2 часа
+# Сохранение и восстановление снимка кэша на диске
+async def save_cache_snapshot():
+    """Сохраняет кэш мастеров, магазинов и результатов запросов в снимок на диске"""
+    if not config.CACHE_SNAPSHOT_ENABLED:
+        return
+    
+    try:
+        start_time = time.time()
+        raw = snapshot.dump_snapshot({
+            "masters": non_empty_masters_cache,
+            "masters_time": non_empty_masters_cache_time,
+            "shops": shops_categories_cache,
+            "shops_time": shops_categories_cache_time,
+            "screens": static_screens,
+            "cache": cache.dump()
+        })
+        # Сжатие и запись на диск выполняются в отдельном потоке
+        await asyncio.get_event_loop().run_in_executor(None, snapshot.write_snapshot, config.CACHE_SNAPSHOT_PATH, raw)
+        # Копия file_id снимается в цикле событий, в поток передается только она
+        changed_file_ids = file_ids.take_changes()
+        if changed_file_ids is not None:
+            await asyncio.get_event_loop().run_in_executor(None, file_ids.write, changed_file_ids)
+        logger.info(f"Снимок кэша сохранен за {time.time() - start_time:.2f} сек ({len(raw) // 1024} КБ до сжатия)")
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении снимка кэша: {e}")
+
+def restore_cache_snapshot():
+    """Восстанавливает кэш из снимка на диске. Возвращает True, если снимок загружен"""
+    if not config.CACHE_SNAPSHOT_ENABLED:
+        return False
+    
+    start_time = time.time()
+    data = snapshot.load_snapshot(config.CACHE_SNAPSHOT_PATH)
+    if not data:
+        return False
+    
+    restored = apply_cache_snapshot(data)
+    logger.info(f"✅ Кэш восстановлен из снимка за {(time.time() - start_time) * 1000:.0f} мс")
+    return restored
+
+def apply_cache_snapshot(data):
+    """Заменяет кэш мастеров, магазинов и запросов данными снимка. Возвращает True, если есть мастера"""
+    global non_empty_masters_cache, non_empty_masters_cache_time
+    global shops_categories_cache, shops_categories_cache_time
+    
+    masters = data.get("masters") or {}
+    if masters:
+        # JSON не сохраняет кортежи и целочисленные ключи, восстанавливаем их
+        masters["buttons"] = [tuple(button) for button in masters.get("buttons", [])]
+        masters["master_works"] = {
+            cat: {int(photo_id): works for photo_id, works in cat_works.items()}
+            for cat, cat_works in masters.get("master_works", {}).items()
+        }
+    
+    non_empty_masters_cache = masters
+    non_empty_masters_cache_time = data.get("masters_time", 0)
+    shops_categories_cache = data.get("shops") or {}
+    shops_categories_cache_time = data.get("shops_time", 0)
+    # Записи старых снимков с токеном ВК в ключе не загружаем
+    cache.load({
+        key: entry for key, entry in (data.get("cache") or {}).items()
+        if not config.VK_TOKEN or config.VK_TOKEN not in key
+    })
+    static_screens.update(data.get("screens") or {})
+    build_master_render_cache()
+    return bool(non_empty_masters_cache)
+
+# Обработчики кластера не обращаются к ВК за каталогом, а читают снимок, опубликованный процессом обновления
+async def watch_published_snapshot():
+    """Перечитывает снимок каталога, когда процесс обновления публикует новую версию"""
+    loaded_version = None
+    while True:
+        try:
+            version = snapshot.snapshot_version(config.CACHE_SNAPSHOT_PATH)
+            if version is not None and version != loaded_version:
+                start_time = time.time()
+                # Распаковка и разбор JSON выполняются в отдельном потоке
+                data = await asyncio.get_event_loop().run_in_executor(
+                    None, snapshot.load_snapshot, config.CACHE_SNAPSHOT_PATH
+                )
+                if data:
+                    apply_cache_snapshot(data)
+                    logger.info(f"✅ Загружена новая версия каталога за {(time.time() - start_time) * 1000:.0f} мс")
+                loaded_version = version
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке опубликованного снимка каталога: {e}")
+        await asyncio.sleep(config.SNAPSHOT_POLL_INTERVAL)
+
+# Периодическое обновление кэша: полное каждые 2 часа, инкрементальное между ними
 async def periodic_cache_update():
     """Периодически обновляет кэш магазинов и мастеров"""
     while True:
         try:
+            # Между полными обновлениями проверяем только изменившиеся альбомы мастеров
+            last_full_update = non_empty_masters_cache.get("full_update_time", 0)
+            if (config.INCREMENTAL_UPDATE_ENABLED and "album_meta" in non_empty_masters_cache and
+                    time.time() - last_full_update < CACHE_UPDATE_INTERVAL):
+                logger.info("Запуск инкрементального обновления базы мастеров")
+                if await refresh_masters_incremental():
+                    await save_cache_snapshot()
+                await asyncio.sleep(config.INCREMENTAL_UPDATE_INTERVAL)
+                continue
+            
             logger.info("Запуск планового обновления кэша (каждые 2 часа)")
             
             # Обновляем данные о мастерах
@@ -208,13 +303,31 @@ async def periodic_cache_update():
             
             # Обновляем данные о магазинах
             shops = await get_shop_list_async(config.VK_TOKEN, config.VK_GROUP_ID, force_update=True)
-            global shops_categories_cache, shops_categories_cache_time
-            shops_categories_cache = shops
-            shops_categories_cache_time = time.time()
-            logger.info("✅ Кэш магазинов успешно обновлен")
+            if store_shop_catalog(shops):
+                logger.info("✅ Кэш магазинов успешно обновлен")
+            
+            # Обновляем экраны приветствия и заявок
+            await refresh_static_screens()
+            
+            # Обработчики кластера берут товары маркета только из снимка, поэтому загружаем их заранее
+            if config.BOT_ROLE == 'refresher':
+                await preload_market_data()
+            
+            # Удаляем file_id фотографий, которых больше нет в данных из ВК
+            if non_empty_masters_cache and shops_categories_cache.get("all_shops"):
+                valid_urls = collect_photo_urls([non_empty_masters_cache, shops_categories_cache, cache.dump()])
+                removed = file_ids.prune(valid_urls)
+                if removed:
+                    logger.info(f"Удалено {removed} устаревших file_id фотографий")
+            
+            # Сохраняем снимок кэша для быстрого перезапуска
+            await save_cache_snapshot()
             
             # Ждем следующего обновления
-            await asyncio.sleep(CACHE_UPDATE_INTERVAL)
+            if config.INCREMENTAL_UPDATE_ENABLED:
+                await asyncio.sleep(config.INCREMENTAL_UPDATE_INTERVAL)
+            else:
+                await asyncio.sleep(CACHE_UPDATE_INTERVAL)
         except Exception as e:
             logger.error(f"Ошибка при плановом обновлении кэша: {e}")
             # В случае ошибки пробуем снова через 10 минут
@@ -227,9 +340,8 @@ async def preload_critical_data():
         # Загружаем только основные данные, которые нужны для быстрого старта
         logger.info("Предварительная загрузка критических данных...")
         
-        # Загрузка описания группы (легкий запрос)
-        await vk_api_rate_limit()
-        await get_group_description_async(config.VK_TOKEN, config.VK_GROUP_ID)
+        # Загрузка описания группы и тем для заявок (легкие запросы)
+        await refresh_static_screens()
         
         # Предварительно загружаем всю базу мастеров синхронно, чтобы обеспечить мгновенный отклик
         await preload_masters_data()
@@ -240,79 +352,156 @@ async def preload_critical_data():
     except Exception as e:
         logger.error(f"Ошибка при предварительной загрузке критических данных: {e}")
 
+def preload_concurrency():
+    """Количество одновременных запросов к ВК при загрузке базы мастеров"""
+    if config.PRELOAD_CONCURRENCY > 0:
+        return config.PRELOAD_CONCURRENCY
+    # По умолчанию - по лимиту запросов в секунду для типа токена
+    return config.VK_GROUP_TOKEN_RPS if config.VK_TOKEN_TYPE == 'group' else config.VK_USER_TOKEN_RPS
+
+class PreloadPhase:
+    """Время этапа загрузки: от начала первого запроса до конца последнего и суммарное время запросов"""
+    
+    def __init__(self):
+        self.requests = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+    
+    @contextlib.asynccontextmanager
+    async def measure(self):
+        start = time.time()
+        if self.started is None:
+            self.started = start
+        try:
+            yield
+        finally:
+            self.finished = time.time()
+            self.requests += 1
+            self.busy += self.finished - start
+    
+    def __str__(self):
+        if self.started is None:
+            return "нет запросов"
+        return f"{self.finished - self.started:.2f} сек, {self.requests} запросов, суммарно {self.busy:.2f} сек"
+
 # Функция для полной загрузки базы мастеров
 async def preload_masters_data():
     """Предварительно загружает все данные о мастерах, включая категории, фотографии и работы"""
     global non_empty_masters_cache, non_empty_masters_cache_time
+    if config.BOT_ROLE == 'worker':
+        # Базу мастеров загружает процесс обновления, обработчик ждет следующий снимок
+        logger.warning("⚠️ База мастеров еще не опубликована процессом обновления")
+        return
     try:
         logger.info("Начинаю загрузку полной базы мастеров...")
         start_time = time.time()
         
-        # Загружаем альбомы мастеров
-        await vk_api_rate_limit()
-        albums = await get_album_names_async(config.VK_TOKEN, config.VK_GROUP_ID)
+        # Загружаем альбомы мастеров вместе с временем их изменения
+        album_meta = await vk_async.get_albums_meta(config.VK_TOKEN, config.VK_GROUP_ID)
+        albums = {cat: meta["id"] for cat, meta in album_meta.items()}
         logger.info(f"✅ Альбомы мастеров загружены: найдено {len(albums)} категорий")
         
         if not albums:
             logger.warning("⚠️ Не найдено категорий мастеров")
             return
         
-        # Создаем задачи для параллельной загрузки фотографий мастеров
-        tasks = []
-        for cat, album_id in albums.items():
-            await vk_api_rate_limit()
-            tasks.append((cat, album_id, get_album_photos_async(config.VK_TOKEN, config.VK_GROUP_ID, album_id)))
+        # Каждый запрос к ВК занимает место в семафоре, поэтому загрузка фото одних категорий
+        # идет одновременно с загрузкой комментариев других, но не больше лимита запросов
+        semaphore = asyncio.Semaphore(preload_concurrency())
+        phases = {"фото мастеров": PreloadPhase(), "работы мастеров": PreloadPhase()}
+        
+        @contextlib.asynccontextmanager
+        async def request_slot(phase):
+            async with semaphore, phases[phase].measure():
+                yield
+        
+        async def load_batch(batch):
+            async with request_slot("работы мастеров"):
+                return await get_photos_comments_batch_async(config.VK_TOKEN, config.VK_GROUP_ID, batch)
         
-        # Обрабатываем результаты загрузки фотографий мастеров
+        async def load_category(cat, album_id):
+            photos = []
+            batch_tasks = []
+            batch_size = config.VK_EXECUTE_BATCH_SIZE
+            try:
+                # Страницы фото приходят по мере загрузки; полное обновление всегда запрашивает их заново,
+                # чтобы увидеть новые комментарии и описания, которые не меняют время изменения альбома
+                async for page in vk_async.iter_album_photos(
+                        config.VK_TOKEN, config.VK_GROUP_ID, album_id, album_meta[cat],
+                        request_slot=lambda: request_slot("фото мастеров"), refresh=True):
+                    photos.extend(page)
+                    
+                    # В ленивом режиме работы загружаются при первом просмотре, а не при прогреве
+                    if config.LAZY_MASTER_WORKS:
+                        continue
+                    
+                    # Работы мастеров страницы (пакетами через execute) загружаются, пока идет следующая страница
+                    photo_ids = [photo.get('id') for photo in page if photo.get('id')]
+                    for i in range(0, len(photo_ids), batch_size):
+                        batch_tasks.append(asyncio.ensure_future(load_batch(photo_ids[i:i + batch_size])))
+            except Exception as e:
+                logger.error(f"Ошибка при получении фотографий из альбома {album_id}: {e}")
+                for task in batch_tasks:
+                    task.cancel()
+                return [], []
+            
+            return photos, await asyncio.gather(*batch_tasks)
+        
+        results = await asyncio.gather(*[load_category(cat, album_id) for cat, album_id in albums.items()])
+        
+        # Обрабатываем результаты загрузки в порядке альбомов
+        previous_photos = non_empty_masters_cache.get("master_photos") or {}
+        previous_works = non_empty_masters_cache.get("master_works") or {}
         category_buttons = []
         all_categories = {}
         all_master_photos = {}
         master_works = {}
         
-        # Сохраняем все категории и их ID
-        for cat, album_id in albums.items():
+        for (cat, album_id), (photos, batches) in zip(albums.items(), results):
             all_categories[cat] = album_id
-        
-        # Получаем информацию о количестве фото в каждой категории
-        for cat, album_id, task in tasks:
-            photos = await task
             count = len(photos) if photos else 0
             category_buttons.append((cat, count))
             
             # Сохраняем фотографии мастеров категории
             all_master_photos[cat] = photos
             
-            # Для каждого мастера также загружаем его работы
-            cat_work_tasks = []
-            if photos:
-                for photo in photos:
-                    photo_id = photo.get('id')
-                    if photo_id:
-                        await vk_api_rate_limit()
-                        cat_work_tasks.append((photo_id, get_photo_comments_async(config.VK_TOKEN, config.VK_GROUP_ID, photo_id)))
-            
             # Получаем работы для мастеров категории
             cat_works = {}
-            for photo_id, work_task in cat_work_tasks:
-                works = await work_task
-                if works and len(works) > 0:
-                    cat_works[photo_id] = works
+            if config.LAZY_MASTER_WORKS:
+                # Работы, загруженные по требованию, сохраняются, если у мастера не изменилось число комментариев
+                old_comments = {photo.get('id'): photo.get('comments') for photo in previous_photos.get(cat) or []}
+                old_works = previous_works.get(cat, {})
+                for photo in photos:
+                    photo_id = photo.get('id')
+                    if photo_id in old_works and old_comments.get(photo_id) == photo.get('comments'):
+                        cat_works[photo_id] = old_works[photo_id]
+            for works_by_photo in batches:
+                for photo_id, works in works_by_photo.items():
+                    if works and len(works) > 0:
+                        cat_works[photo_id] = works
             
             # Сохраняем работы мастеров категории
             if cat_works:
                 master_works[cat] = cat_works
                 logger.info(f"✅ Категория '{cat}': загружено {len(photos)} мастеров и {len(cat_works)} мастеров с работами")
             else:
-                logger.info(f"✅ Категория '{cat}': загружено {len(photos)} мастеров (без работ)")
+                logger.info(f"✅ Категория '{cat}': загружено {count} мастеров (без работ)")
+        
+        for name, phase in phases.items():
+            logger.info(f"⏱ Этап '{name}': {phase}")
         
         # Сохраняем результаты в кэш
         non_empty_masters_cache = {
             "buttons": category_buttons,
             "all_categories": all_categories,
             "master_photos": all_master_photos,
-            "master_works": master_works
+            "master_works": master_works,
+            "album_meta": album_meta,
+            "full_update_time": time.time()
         }
         non_empty_masters_cache_time = time.time()
+        build_master_render_cache()
         
         execution_time = time.time() - start_time
         logger.info(f"✅ Предзагрузка базы мастеров завершена за {execution_time:.2f} сек")
@@ -321,6 +510,117 @@ async def preload_masters_data():
     except Exception as e:
         logger.error(f"Ошибка при загрузке базы мастеров: {e}")
 
+async def refresh_masters_incremental():
+    """
+    Инкрементально обновляет базу мастеров.
+    
+    Фотографии перезагружаются только для альбомов, у которых изменились
+    время обновления или количество фото, а комментарии - только для фото,
+    у которых изменилось число комментариев. Кэш мастеров обновляется на месте.
+    
+    Returns:
+        True, если в базе мастеров что-то изменилось
+    """
+    global non_empty_masters_cache_time
+    
+    if "album_meta" not in non_empty_masters_cache:
+        # Нет данных об альбомах для сравнения - нужна полная загрузка
+        await preload_masters_data()
+        return True
+    
+    start_time = time.time()
+    album_meta = await vk_async.get_albums_meta(config.VK_TOKEN, config.VK_GROUP_ID)
+    if not album_meta:
+        logger.warning("⚠️ Не удалось получить метаданные альбомов, инкрементальное обновление пропущено")
+        return False
+    
+    old_meta = non_empty_masters_cache["album_meta"]
+    all_master_photos = non_empty_masters_cache.setdefault("master_photos", {})
+    master_works = non_empty_masters_cache.setdefault("master_works", {})
+    
+    changed = [cat for cat, meta in album_meta.items() if old_meta.get(cat) != meta]
+    removed = [cat for cat in old_meta if cat not in album_meta]
+    
+    if not changed and not removed:
+        non_empty_masters_cache_time = time.time()
+        logger.info(f"✅ Альбомы мастеров не изменились (проверка за {time.time() - start_time:.2f} сек)")
+        return False
+    
+    failed = []
+    for cat in changed:
+        # Фото загружаются мимо кэша запросов: полный список альбома хранится только в базе мастеров
+        photos = []
+        try:
+            async for page in vk_async.iter_album_photos(config.VK_TOKEN, config.VK_GROUP_ID, album_meta[cat]["id"], album_meta[cat]):
+                photos.extend(page)
+        except Exception as e:
+            logger.error(f"Ошибка при получении фотографий из альбома {album_meta[cat]['id']}: {e}")
+            photos = []
+        
+        if not photos and album_meta[cat].get("size"):
+            # Ошибка ВК - оставляем прежние фото и метаданные, категория обновится при следующем проходе
+            logger.warning(f"⚠️ Не удалось обновить категорию '{cat}', оставлены прежние данные")
+            failed.append(cat)
+            continue
+        
+        old_photos = {photo.get('id'): photo for photo in all_master_photos.get(cat) or []}
+        old_works = master_works.get(cat, {})
+        
+        # Комментарии запрашиваем только для новых фото и фото с изменившимся числом комментариев
+        to_fetch = []
+        cat_works = {}
+        for photo in photos:
+            photo_id = photo.get('id')
+            if not photo_id:
+                continue
+            old_photo = old_photos.get(photo_id)
+            if old_photo is None or old_photo.get('comments') != photo.get('comments'):
+                to_fetch.append(photo_id)
+            elif photo_id in old_works:
+                cat_works[photo_id] = old_works[photo_id]
+        
+        if config.LAZY_MASTER_WORKS:
+            # Работы новых и изменившихся мастеров загрузятся при первом просмотре
+            to_fetch = []
+        
+        if to_fetch:
+            works_by_photo = await get_photos_comments_batch_async(config.VK_TOKEN, config.VK_GROUP_ID, to_fetch)
+            for photo_id in to_fetch:
+                if photo_id in works_by_photo:
+                    if works_by_photo[photo_id]:
+                        cat_works[photo_id] = works_by_photo[photo_id]
+                elif photo_id in old_works:
+                    # Не удалось получить комментарии - оставляем прежние работы
+                    cat_works[photo_id] = old_works[photo_id]
+        
+        all_master_photos[cat] = photos
+        if cat_works:
+            master_works[cat] = cat_works
+        else:
+            master_works.pop(cat, None)
+        logger.info(f"✅ Категория '{cat}' обновлена: {len(photos)} мастеров, запрошены комментарии к {len(to_fetch)} фото")
+    
+    for cat in removed:
+        all_master_photos.pop(cat, None)
+        master_works.pop(cat, None)
+        logger.info(f"Категория '{cat}' удалена из базы мастеров")
+    
+    # Для необновившихся категорий сохраняем прежние метаданные (новые категории без них перезагрузятся)
+    for cat in failed:
+        if cat in old_meta:
+            album_meta[cat] = old_meta[cat]
+    stored_meta = {cat: meta for cat, meta in album_meta.items() if cat not in failed or cat in old_meta}
+    
+    # Кнопки и список категорий пересобираем в порядке альбомов ВК
+    non_empty_masters_cache["buttons"] = [(cat, len(all_master_photos.get(cat) or [])) for cat in album_meta]
+    non_empty_masters_cache["all_categories"] = {cat: meta["id"] for cat, meta in album_meta.items()}
+    non_empty_masters_cache["album_meta"] = stored_meta
+    non_empty_masters_cache_time = time.time()
+    build_master_render_cache()
+    
+    logger.info(f"✅ Инкрементальное обновление мастеров завершено за {time.time() - start_time:.2f} сек: изменено {len(changed) - len(failed)}, не обновлено {len(failed)}, удалено {len(removed)} категорий")
+    return True
+
 async def preload_remaining_data():
     """Асинхронно загружает остальные данные после запуска бота (магазины, маркет)"""
     try:
@@ -330,39 +630,42 @@ async def preload_remaining_data():
         logger.info("Начинаю фоновую загрузку данных магазинов и маркета...")
         
         # Загружаем категории магазинов (ресурсоемкий запрос)
-        await vk_api_rate_limit()
-        global shops_categories_cache, shops_categories_cache_time
         shops = await get_shop_list_async(config.VK_TOKEN, config.VK_GROUP_ID)
-        shops_categories_cache = shops
-        shops_categories_cache_time = time.time()
-        logger.info("✅ Категории магазинов загружены в фоновом режиме")
+        if store_shop_catalog(shops):
+            logger.info("✅ Категории магазинов загружены в фоновом режиме")
         
         # Загружаем категории маркета
-        await vk_api_rate_limit()
         await get_market_categories_async(config.VK_TOKEN, config.VK_GROUP_ID)
         logger.info("✅ Категории маркета загружены в фоновом режиме")
         
+        # Сохраняем снимок кэша для быстрого перезапуска
+        await save_cache_snapshot()
+        
         logger.info("✅ Фоновая загрузка дополнительных данных завершена")
         
     except Exception as e:
         logger.error(f"Ошибка при фоновой загрузке дополнительных данных: {e}")
 
+async def preload_market_data():
+    """Загружает категории маркета и товары всех категорий в кэш запросов (для снимка каталога)"""
+    start_time = time.time()
+    categories = await get_market_categories_async(config.VK_TOKEN, config.VK_GROUP_ID, force_update=True) or {}
+    for album_id in categories.values():
+        await get_market_items_async(config.VK_TOKEN, config.VK_GROUP_ID, album_id, force_update=True)
+    logger.info(f"✅ Товары маркета загружены за {time.time() - start_time:.2f} сек: {len(categories)} категорий")
+
+# Запросы, выполняющиеся прямо сейчас, по ключам кэша
+inflight_requests = {}
+
+def cache_key(func_name, args, kwargs):
+    """Ключ кэша: имя функции и хэш аргументов (токен ВК не попадает в снимок и логи)"""
+    digest = hashlib.sha256(repr((args, sorted(kwargs.items()))).encode()).hexdigest()[:16]
+    return f"{func_name}:{digest}"
+
 # Функция для кэширования результатов
 def cached(func):
-    async def wrapper(*args, force_update=False, **kwargs):
-        key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
+    async def refresh(key, args, kwargs, previous=None):
         current_time = time.time()
-        
-        # Проверяем, есть ли данные в кэше и не устарели ли они
-        if (key in cache and not force_update and 
-            current_time - cache[key]['time'] < config.CACHE_TIME):
-            logger.info(f"Данные получены из кэша: {func.__name__}")
-            return cache[key]['data']
-        
-        # Применяем ограничение частоты запросов
-        await vk_api_rate_limit()
-        
-        # Если данных нет в кэше или нужно обновить их, вызываем функцию
         start_time = time.time()
         result = await func(*args, **kwargs)
         execution_time = time.time() - start_time
@@ -371,30 +674,170 @@ def cached(func):
         if execution_time > 1.0:
             logger.info(f"Тяжелый запрос {func.__name__} выполнен за {execution_time:.2f} сек")
         
-        cache[key] = {'data': result, 'time': current_time}
+        if result is None:
+            # Запрос не удался - результат не кэшируется, при следующем обращении запрос повторится
+            logger.warning(f"Обновление {func.__name__} не удалось, результат не сохранен в кэш")
+            return previous
+        
+        if not result and previous:
+            # Обертки ВК при ошибке возвращают пустой результат - оставляем прежние данные,
+            # запись остается устаревшей и обновится при следующем обращении
+            logger.warning(f"Обновление {func.__name__} вернуло пустой результат, оставлены прежние данные")
+            return previous
+        
+        cache.set(key, result, timestamp=current_time)
         logger.info(f"Данные обновлены в кэше: {func.__name__}")
         return result
+    
+    def on_refresh_done(key, future):
+        inflight_requests.pop(key, None)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Ошибка при обновлении кэша {func.__name__}: {future.exception()}")
+    
+    def start_refresh(key, args, kwargs, previous=None):
+        # Одинаковые запросы объединяются: все вызывающие ждут один и тот же запрос к ВК
+        future = inflight_requests.get(key)
+        if future is None:
+            future = asyncio.ensure_future(refresh(key, args, kwargs, previous))
+            inflight_requests[key] = future
+            future.add_done_callback(lambda f: on_refresh_done(key, f))
+        return future
+    
+    async def wrapper(*args, force_update=False, **kwargs):
+        key = cache_key(func.__name__, args, kwargs)
+        entry = cache.get(key)
+        
+        if config.BOT_ROLE == 'worker':
+            # Обработчик кластера отдает только данные из снимка (даже устаревшие) и не обновляет их из ВК
+            return entry['data'] if entry is not None else None
+        
+        if entry is not None and not force_update:
+            # Проверяем, не устарели ли данные в кэше
+            if cache.is_fresh(entry):
+                logger.info(f"Данные получены из кэша: {func.__name__}")
+                return entry['data']
+            
+            # Устаревшие данные отдаем сразу, а обновляем их в фоне
+            start_refresh(key, args, kwargs, entry['data'])
+            logger.info(f"Устаревшие данные получены из кэша, запущено фоновое обновление: {func.__name__}")
+            return entry['data']
+        
+        # Если данных нет в кэше или нужно обновить их, ждем общий запрос.
+        # shield не дает отмене одного вызывающего прервать запрос для остальных
+        previous = entry['data'] if entry is not None else None
+        return await asyncio.shield(start_refresh(key, args, kwargs, previous))
     return wrapper
 
 @cached
 async def get_group_description_async(token, group_id, force_update=False):
     """Асинхронная обертка для получения описания группы"""
-    # Применяем ограничение частоты запросов
-    await vk_api_rate_limit()
+    return await vk_async.get_group_description(token, group_id)
+
+def parse_topic_id(topic_url, default):
+    """Извлекает ID темы из URL вида https://vk.com/topic-GROUP_ID_TOPIC_ID"""
+    try:
+        parts = topic_url.split("topic-")
+        if len(parts) > 1:
+            parts = parts[1].split("_")
+            if len(parts) > 1 and parts[1]:
+                return parts[1]
+    except Exception as e:
+        logger.error(f"Ошибка при извлечении ID темы из URL {topic_url}: {e}")
+    return default
+
+# ID тем для заявок извлекаются из URL один раз при запуске
+PARTNER_TOPIC_ID = parse_topic_id(config.VK_PARTNER_TOPIC_URL, "49010445")
+MASTER_TOPIC_ID = parse_topic_id(config.VK_MASTER_TOPIC_URL, "49010449")
+
+# Готовые тексты экранов, не зависящих от пользователя: {"welcome", "partner", "master"}
+static_screens = {}
+
+def render_welcome_screen(description):
+    """Текст приветствия (без обращения к пользователю)"""
+    return description or config.WELCOME_MESSAGE
+
+def render_partner_screen(topic_info):
+    """Текст экрана "Стать магазином-партнером" по данным темы ВК"""
+    text_message = "🤝 <b>Стать магазином-партнером</b>\n\n"
     
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, vk.get_group_description, token, group_id)
+    # Добавляем информацию из темы, если она доступна
+    if topic_info:
+        # Используем заголовок темы, если он есть
+        if topic_info["title"] and topic_info["title"] != "Без названия":
+            text_message = f"🤝 <b>{topic_info['title']}</b>\n\n"
+        
+        # Если есть текст первого сообщения, добавляем его полностью
+        if topic_info["text"]:
+            text_message += f"{topic_info['text']}\n\n"
+    else:
+        text_message += "Чтобы стать магазином-партнером, перейдите по ссылке ниже и оставьте заявку:\n"
+    
+    # Добавляем ссылку на тему
+    text_message += f"<a href='{config.VK_PARTNER_TOPIC_URL}'>Оставить заявку в ВКонтакте</a>"
+    return text_message
+
+def render_master_screen(topic_info):
+    """Текст экрана "Попасть в базу мастеров" по данным темы ВК"""
+    text_message = "📋 <b>Хочу в базу мастеров и спецтехники</b>\n\n"
+    
+    # Используем заголовок темы, если он есть
+    if topic_info and topic_info["title"] and topic_info["title"] != "Без названия":
+        text_message = f"📋 <b>{topic_info['title']}</b>\n\n"
+    
+    text_message += (
+        "Чтобы попасть в базу мастеров:\n\n"
+        "1️⃣ Подготовьте фотографию с информацией о ваших услугах\n"
+        "2️⃣ Укажите категорию услуг\n"
+        "3️⃣ Оставьте заявку по ссылке"
+    )
+    
+    # Добавляем ссылку на тему
+    text_message += f"\n\n<a href='{config.VK_MASTER_TOPIC_URL}'>Оставить заявку в ВКонтакте</a>"
+    
+    # Используем полное первое сообщение из темы, если оно доступно
+    if topic_info and topic_info.get("text"):
+        text_message += f"\n\n{topic_info['text']}"
+    return text_message
+
+STATIC_SCREEN_RENDERERS = {
+    "welcome": render_welcome_screen,
+    "partner": render_partner_screen,
+    "master": render_master_screen,
+}
+
+def get_static_screen(name):
+    """Возвращает готовый текст экрана (до первого обновления - текст без данных из ВК)"""
+    text = static_screens.get(name)
+    if text is None:
+        text = STATIC_SCREEN_RENDERERS[name](None)
+    return text
+
+async def refresh_static_screens():
+    """Загружает из ВК описание группы и темы для заявок и заново формирует экраны"""
+    group_id = str(config.VK_GROUP_ID).replace("-", "")
+    results = await asyncio.gather(
+        get_group_description_async(config.VK_TOKEN, config.VK_GROUP_ID, force_update=True),
+        vk_async.get_topic_info(config.VK_TOKEN, group_id, PARTNER_TOPIC_ID),
+        vk_async.get_topic_info(config.VK_TOKEN, group_id, MASTER_TOPIC_ID),
+        return_exceptions=True
+    )
+    
+    for name, result in zip(("welcome", "partner", "master"), results):
+        if isinstance(result, Exception) or not result:
+            # Не удалось получить данные - оставляем прежний экран
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка при обновлении экрана '{name}': {result}")
+            continue
+        static_screens[name] = STATIC_SCREEN_RENDERERS[name](result)
+    
+    logger.info(f"✅ Экраны приветствия и заявок обновлены: {', '.join(sorted(static_screens)) or 'нет данных из ВК'}")
 
 @dp.message_handler(commands=['start', 'help'])
 async def send_welcome(message: types.Message):
     user_name = message.from_user.first_name
     
-    # Получаем описание группы из ВКонтакте или из кэша
-    welcome_message = await get_group_description_async(config.VK_TOKEN, config.VK_GROUP_ID)
-    
-    # Если не удалось получить описание, используем сообщение из конфига
-    if not welcome_message:
-        welcome_message = config.WELCOME_MESSAGE
+    # Описание группы подготовлено заранее и обновляется в фоне
+    welcome_message = get_static_screen("welcome")
     
     await send_message_with_links(
         message,
@@ -403,16 +846,12 @@ async def send_welcome(message: types.Message):
         reply_markup=buttons.main
     )
     
-@dp.message_handler(lambda m: m.text == '◀️ Назад' or m.text == 'Назад' or m.text == '◀️ Назад в главное меню', state='*')
+@router.message('◀️ Назад', 'Назад', '◀️ Назад в главное меню', state='*')
 async def back_to_main(message: types.Message, state: FSMContext):
     user_name = message.from_user.first_name
     
-    # Получаем описание группы из ВКонтакте или из кэша
-    welcome_message = await get_group_description_async(config.VK_TOKEN, config.VK_GROUP_ID)
-    
-    # Если не удалось получить описание, используем сообщение из конфига
-    if not welcome_message:
-        welcome_message = config.WELCOME_MESSAGE
+    # Описание группы подготовлено заранее и обновляется в фоне
+    welcome_message = get_static_screen("welcome")
     
     await send_message_with_links(
         message,
@@ -424,22 +863,148 @@ async def back_to_main(message: types.Message, state: FSMContext):
     
 @cached
 async def get_album_photos_async(token, owner_id, album_id, force_update=False):
-    # Применяем ограничение частоты запросов
-    await vk_api_rate_limit()
-    
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, vk.get_album_photos, token, owner_id, album_id)
+    return await vk_async.get_album_photos(token, owner_id, album_id)
     
 @cached
 async def get_photo_comments_async(token, owner_id, photo_id, force_update=False):
     """Асинхронная обертка для получения комментариев к фотографии"""
-    # Применяем ограничение частоты запросов
-    await vk_api_rate_limit()
+    return await vk_async.get_photo_comments(token, owner_id, photo_id)
+
+async def get_photos_comments_batch_async(token, owner_id, photo_ids):
+    """Асинхронная обертка для пакетного получения комментариев к фотографиям"""
+    return await vk_async.get_photos_comments_batch(token, owner_id, photo_ids)
+
+def get_cached_master_works(category, photo_id):
+    """
+    Возвращает работы мастера из кэша базы мастеров.
+    Возвращает None, если категория еще не загружена в кэш
+    или (в ленивом режиме) работы этого мастера еще не загружались.
+    """
+    if not non_empty_masters_cache or category not in non_empty_masters_cache.get("master_photos", {}):
+        return None
     
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, vk.get_photo_comments, token, owner_id, photo_id)
+    try:
+        photo_id = int(photo_id)
+    except (TypeError, ValueError):
+        return None
+    
+    cat_works = non_empty_masters_cache.get("master_works", {}).get(category, {})
+    if config.LAZY_MASTER_WORKS and photo_id not in cat_works:
+        return None
+    return cat_works.get(photo_id, [])
+
+# В состоянии пользователя хранятся только ссылки (категория, индекс, ID мастера),
+# сами данные берутся из общих кэшей мастеров и магазинов
+async def get_master_categories():
+    """Возвращает словарь {категория мастеров: ID альбома}"""
+    if non_empty_masters_cache.get("all_categories"):
+        return non_empty_masters_cache["all_categories"]
+    if config.BOT_ROLE == 'worker':
+        # Обработчик кластера берет каталог только из снимка процесса обновления
+        return {}
+    return await get_album_names_async(config.VK_TOKEN, config.VK_GROUP_ID)
+
+async def get_master_photos(category):
+    """Возвращает фотографии мастеров категории из кэша базы мастеров (загружает при отсутствии)"""
+    photos = (non_empty_masters_cache.get("master_photos") or {}).get(category)
+    if photos is not None:
+        return photos
+    if config.BOT_ROLE == 'worker':
+        return []
+    
+    album_id = (await get_master_categories()).get(category)
+    if not album_id:
+        return []
+    
+    photos = await get_album_photos_async(config.VK_TOKEN, config.VK_GROUP_ID, album_id)
+    if photos:
+        non_empty_masters_cache.setdefault("master_photos", {})[category] = photos
+        logger.info(f"Сохранил {len(photos)} фотографий мастеров в кэш для категории '{category}'")
+    return photos
+
+async def get_master_works(category, photo_id):
+    """Возвращает работы мастера из кэша базы мастеров или из ВКонтакте"""
+    if not photo_id:
+        return []
+    works = get_cached_master_works(category, photo_id)
+    if works is None and config.BOT_ROLE != 'worker':
+        # Одновременные запросы работ одного мастера объединяются в один запрос к ВК
+        works = await get_photo_comments_async(config.VK_TOKEN, config.VK_GROUP_ID, photo_id)
+        # None - ошибка ВК: работы не запоминаются, чтобы не считать мастера мастером без работ
+        if config.LAZY_MASTER_WORKS and works is not None:
+            remember_master_works(category, photo_id, works)
+    return works or []
+
+def remember_master_works(category, photo_id, works):
+    """Сохраняет загруженные по требованию работы мастера и обновляет его карточку"""
+    try:
+        photo_id = int(photo_id)
+    except (TypeError, ValueError):
+        return
     
-@dp.message_handler(state=User.get_master)
+    photos = (non_empty_masters_cache.get("master_photos") or {}).get(category)
+    if not photos:
+        return
+    
+    # Пустой список тоже сохраняется: он означает, что работ у мастера нет
+    non_empty_masters_cache.setdefault("master_works", {}).setdefault(category, {})[photo_id] = works or []
+    
+    # Карточка мастера теперь показывает точное число работ
+    cards = master_render_cache.get(category)
+    if cards and len(cards) == len(photos):
+        index = find_master_index(photos, photo_id)
+        if cards[index]["id"] == photo_id:
+            cards[index] = render_master_card(category, photos, index, len(works or []))
+
+async def prefetch_neighbour_works(category, photos, current_index):
+    """Заранее загружает работы соседних мастеров карусели (ленивый режим)"""
+    distance = config.LAZY_WORKS_PREFETCH
+    neighbours = photos[max(current_index - distance, 0):current_index + distance + 1]
+    try:
+        await asyncio.gather(*[
+            get_master_works(category, photo.get('id'))
+            for photo in neighbours
+            if photo.get('comments') and get_cached_master_works(category, photo.get('id')) is None
+        ])
+    except Exception as e:
+        logger.error(f"Ошибка при предзагрузке работ мастеров категории '{category}': {e}")
+
+def find_master_index(photos, master_id):
+    """Возвращает индекс мастера с указанным ID (0, если мастер не найден)"""
+    for i, photo in enumerate(photos):
+        if photo.get('id') == master_id:
+            return i
+    return 0
+
+async def get_current_master(data):
+    """Возвращает фотографию текущего мастера по ссылке из состояния пользователя"""
+    master_id = data.get('current_master_id')
+    if not master_id:
+        return {}
+    photos = await get_master_photos(data.get('current_master_category') or data.get('current_category'))
+    for photo in photos:
+        if photo.get('id') == master_id:
+            return photo
+    return {}
+
+def store_shop_catalog(shops):
+    """Сохраняет загруженный каталог магазинов. Пустой результат (ошибка ВК) не заменяет прежний каталог"""
+    global shops_categories_cache, shops_categories_cache_time
+    if not shops or not shops.get("all_shops"):
+        logger.warning("⚠️ Каталог магазинов не получен, оставлен прежний")
+        return False
+    shops_categories_cache = shops
+    shops_categories_cache_time = time.time()
+    buttons.bump_catalog_version()
+    return True
+
+async def get_shop_catalog():
+    """Возвращает общий каталог магазинов (загружает его, если кэш пуст)"""
+    if not shops_categories_cache and config.BOT_ROLE != 'worker':
+        store_shop_catalog(await get_shop_list_async(config.VK_TOKEN, config.VK_GROUP_ID))
+    return shops_categories_cache
+    
+@router.message(state=User.get_master)
 async def show_master(message: types.Message, state: FSMContext):
     # Проверяем, не является ли сообщение командой возврата
     if message.text == "◀️ НАЗАД К КАТЕГОРИЯМ МАСТЕРОВ ◀️" or message.text == "◀️ Вернуться к категориям мастеров":
@@ -447,76 +1012,15 @@ async def show_master(message: types.Message, state: FSMContext):
         await back_to_master_categories(message, state)
         return
     
-    data = await state.get_data()
-    
-    # Убираем эмодзи и счетчик количества из текста сообщения
-    original_text = message.text
-    category = message.text
-    # Список эмодзи, которые могут быть в начале текста
-    emoji_list = ["📋", "📂", "🔧", "🏢", "📝", "🛒", "🔨", "🏪", "🏗", "🚿", "🔌", "🏡", "🧱", "🚜", "🪑", "🌱"]
-    
-    # Убираем все эмодзи из начала текста
-    for emoji in emoji_list:
-        if category.startswith(emoji + " "):
-            category = category[len(emoji) + 1:]
-            break
-    
-    # Убираем счетчик количества в формате [N]
-    if ' [' in category and category.endswith(']'):
-        category = category.split(' [')[0]
-    
-    logger.info(f"Запрос категории: '{original_text}', обработанное название: '{category}'")
-    logger.info(f"Доступные категории: {list(data.keys())}")
+    # Категории мастеров берем из общего кэша, а не из состояния пользователя
+    data = await get_master_categories()
     
-    # Ищем категорию в данных различными способами
-    found_category = None
-    
-    # 1. Прямое совпадение
-    if category in data:
-        found_category = category
-    else:
-        # 2. Поиск без учета регистра
-        for key in data.keys():
-            clean_key = key
-            # Удаляем эмодзи из ключа для сравнения
-            for emoji in emoji_list:
-                if clean_key.startswith(emoji + " "):
-                    clean_key = clean_key[len(emoji) + 1:]
-                    break
-                    
-            logger.info(f"Сравниваем: '{category.lower()}' с '{clean_key.lower()}'")
-            
-            # Проверяем совпадение с очищенными от эмодзи ключами
-            if clean_key.lower() == category.lower():
-                found_category = key
-                logger.info(f"Найдено совпадение: '{key}'")
-                break
-            
-            # Проверяем, если категория в сообщении содержит эмодзи, а ключ - нет
-            for emoji in emoji_list:
-                if original_text.startswith(emoji + " "):
-                    original_without_emoji = original_text[len(emoji) + 1:]
-                    if key.lower() == original_without_emoji.lower():
-                        found_category = key
-                        logger.info(f"Найдено совпадение с оригинальным текстом без эмодзи: '{key}'")
-                        break
-                        
-            # Если до сих пор не нашли совпадение, проверяем, не осталось ли в категории другого текста-суффикса
-            if not found_category:
-                # Дополнительная проверка для различных вариантов суффиксов
-                for suffix in [" мастера", " и спецтехника", " услуги"]:
-                    test_category = category
-                    if test_category.endswith(suffix):
-                        test_category = test_category[:-len(suffix)]
-                    
-                    if clean_key.lower() == test_category.lower():
-                        found_category = key
-                        logger.info(f"Найдено совпадение после удаления суффикса: '{key}'")
-                        break
+    # Ищем категорию по нормализованному тексту кнопки (без эмодзи, счетчика [N], регистра и суффиксов)
+    found_category = name_indexes.find("master_categories", data, message.text)
     
     # Если категория не найдена
     if not found_category:
-        logger.warning(f"Категория не найдена: '{category}'. Доступные категории: {list(data.keys())}")
+        logger.warning(f"Категория не найдена: '{message.text}'")
         
         # Используем данные из кэша для отображения доступных категорий
         global non_empty_masters_cache
@@ -525,9 +1029,8 @@ async def show_master(message: types.Message, state: FSMContext):
         else:
             # Если кэша нет, формируем список категорий (редкий случай)
             category_buttons = []
-            for cat, album_id in data.items():
-                await vk_api_rate_limit()  # Применяем ограничение API
-                photos = await get_album_photos_async(config.VK_TOKEN, config.VK_GROUP_ID, album_id)
+            for cat in data:
+                photos = await get_master_photos(cat)
                 category_buttons.append((cat, len(photos)))
         
         await message.answer("⚠️ Извините, такой категории не найдено. Выберите категорию из списка ниже.", 
@@ -538,25 +1041,15 @@ async def show_master(message: types.Message, state: FSMContext):
     loading_message = await message.answer(f"🔍 <b>Загружаю информацию о мастерах категории:</b> {found_category}...", 
                         parse_mode=ParseMode.HTML)
     
-    # Пытаемся получить фотографии мастеров из кэша
-    photos = []
-    if non_empty_masters_cache and "master_photos" in non_empty_masters_cache and found_category in non_empty_masters_cache["master_photos"]:
-        photos = non_empty_masters_cache["master_photos"][found_category]
-        logger.info(f"Использую кэшированные фотографии мастеров для категории '{found_category}'")
-    else:
-        # Если в кэше нет, загружаем фотографии
-        current = data.get(found_category)
-        logger.info(f"Загружаем альбом ID: {current} для категории '{found_category}'")
-        await vk_api_rate_limit()  # Применяем ограничение API
-        photos = await get_album_photos_async(config.VK_TOKEN, config.VK_GROUP_ID, current)
+    # Получаем фотографии мастеров из кэша базы мастеров
+    photos = await get_master_photos(found_category)
     
     # Удаляем сообщение о загрузке после получения данных
     await loading_message.delete()
     
-    # Сохраняем выбранную категорию и фотографии в состоянии для карусели
+    # Сохраняем в состоянии только выбранную категорию и позицию в карусели
     await state.update_data(
         current_master_category=found_category,
-        master_photos=photos,
         current_photo_index=0
     )
     
@@ -572,42 +1065,16 @@ async def show_master(message: types.Message, state: FSMContext):
     # Переходим в состояние просмотра карусели мастеров
     await User.view_masters_carousel.set()
 
-# Функция для отправки фотографии мастера с кнопками навигации
-async def send_master_photo(chat_id, state, edit_message_id=None):
-    # Получаем данные из состояния
-    data = await state.get_data()
-    photos = data.get('master_photos', [])
-    current_index = data.get('current_photo_index', 0)
-    category = data.get('current_master_category', 'Мастера')
-    
-    if not photos or len(photos) == 0:
-        text_no_photos = "⚠️ Фотографии не найдены."
-        # Добавляем футер с ссылками
-        text_no_photos_with_links = add_links_footer(text_no_photos)
-        
-        if edit_message_id:
-            await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=edit_message_id,
-                text=text_no_photos_with_links,
-                parse_mode=ParseMode.HTML,
-                reply_markup=buttons.navigation_keyboard(include_masters_categories=True)
-            )
-        else:
-            await bot.send_message(
-                chat_id=chat_id,
-                text=text_no_photos_with_links,
-                parse_mode=ParseMode.HTML,
-                reply_markup=buttons.navigation_keyboard(include_masters_categories=True)
-            )
-        return
-    
-    # Получаем текущую фотографию
+# Готовые подписи и клавиатуры карусели мастеров: {категория: [карточка мастера, ...]}
+master_render_cache = {}
+
+def render_master_card(category, photos, current_index, works_count):
+    """
+    Формирует карточку мастера для карусели: подпись с футером,
+    признак слишком длинной подписи и клавиатуру в виде JSON
+    """
     photo = photos[current_index]
     
-    # Сохраняем информацию о текущем мастере в состоянии
-    await state.update_data(master_info=photo)
-    
     # Формируем подпись
     master_name = photo.get('text', '').strip()
     master_fio = master_name.split('\n')[0] if master_name and '\n' in master_name else master_name
@@ -632,17 +1099,13 @@ async def send_master_photo(chat_id, state, edit_message_id=None):
     # Добавляем счетчик
     kb.add(InlineKeyboardButton(f"{current_index+1}/{len(photos)}", callback_data="master_count"))
     
-    # Добавляем кнопку для просмотра работ мастера
-    # Сначала проверяем, есть ли у фотографии ID для получения комментариев
+    # Добавляем кнопку "Работы мастера" с количеством работ
+    # (works_count равен None, если работы еще не загружались - тогда кнопка есть у мастеров с комментариями)
     photo_id = photo.get('id')
-    if photo_id:
-        # Проверяем, есть ли у этого мастера работы
-        work_photos = await get_photo_comments_async(config.VK_TOKEN, config.VK_GROUP_ID, photo_id)
-        works_count = len(work_photos) if work_photos else 0
-        
-        # Добавляем кнопку "Работы мастера" с количеством работ
-        if works_count > 0:
-            kb.add(InlineKeyboardButton(f"📸 Посмотреть работы мастера [{works_count}]", callback_data=f"master_works_{photo_id}"))
+    if photo_id and works_count is None and photo.get('comments'):
+        kb.add(InlineKeyboardButton("📸 Посмотреть работы мастера", callback_data=f"master_works_{photo_id}"))
+    elif photo_id and works_count:
+        kb.add(InlineKeyboardButton(f"📸 Посмотреть работы мастера [{works_count}]", callback_data=f"master_works_{photo_id}"))
     
     # Добавляем кнопку возврата к категориям мастеров
     kb.add(InlineKeyboardButton("◀️ Вернуться к категориям", callback_data="master_back_to_categories"))
@@ -650,32 +1113,134 @@ async def send_master_photo(chat_id, state, edit_message_id=None):
     # Добавляем кнопку возврата в главное меню
     kb.add(InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu"))
     
+    return {
+        "id": photo_id,
+        "caption": full_caption,
+        "long_caption": len(full_caption) > 1024,
+        "keyboard": kb.as_json()
+    }
+
+def master_works_count(cat_works, photo_id):
+    """Количество работ мастера или None, если в ленивом режиме они еще не загружались"""
+    if config.LAZY_MASTER_WORKS and photo_id not in cat_works:
+        return None
+    return len(cat_works.get(photo_id) or [])
+
+def build_master_render_cache():
+    """Заранее формирует карточки всех мастеров из кэша базы мастеров"""
+    global master_render_cache
+    start_time = time.time()
+    
+    render_cache = {}
+    master_works = non_empty_masters_cache.get("master_works", {})
+    for category, photos in (non_empty_masters_cache.get("master_photos") or {}).items():
+        if not photos:
+            continue
+        cat_works = master_works.get(category, {})
+        render_cache[category] = [
+            render_master_card(category, photos, index, master_works_count(cat_works, photo.get('id')))
+            for index, photo in enumerate(photos)
+        ]
+    
+    master_render_cache = render_cache
+    buttons.bump_catalog_version()
+    logger.info(f"Карточки мастеров подготовлены за {(time.time() - start_time) * 1000:.0f} мс: {sum(len(cards) for cards in render_cache.values())} шт.")
+
+async def get_master_card(category, photos, current_index):
+    """Возвращает готовую карточку мастера, а если ее нет - формирует на лету"""
+    cards = master_render_cache.get(category)
+    photo = photos[current_index]
+    if cards and len(cards) == len(photos) and cards[current_index]["id"] == photo.get('id'):
+        return cards[current_index]
+    
+    # Фотографии в состоянии пользователя расходятся с кэшем - формируем карточку на лету
+    works_count = 0
+    photo_id = photo.get('id')
+    if photo_id:
+        # Проверяем, есть ли у этого мастера работы (сначала в кэше базы мастеров)
+        work_photos = get_cached_master_works(category, photo_id)
+        if work_photos is None and config.LAZY_MASTER_WORKS:
+            # Работы загрузятся по нажатию кнопки
+            works_count = None
+        else:
+            if work_photos is None:
+                work_photos = await get_photo_comments_async(config.VK_TOKEN, config.VK_GROUP_ID, photo_id)
+            works_count = len(work_photos) if work_photos else 0
+    
+    return render_master_card(category, photos, current_index, works_count)
+
+# Функция для отправки фотографии мастера с кнопками навигации
+async def send_master_photo(chat_id, state, edit_message_id=None):
+    # Получаем данные из состояния
+    data = await state.get_data()
+    category = data.get('current_master_category', 'Мастера')
+    photos = await get_master_photos(category)
+    # База мастеров могла обновиться, поэтому индекс ограничиваем числом фотографий
+    current_index = min(data.get('current_photo_index', 0), max(len(photos) - 1, 0))
+    
+    if not photos or len(photos) == 0:
+        text_no_photos = "⚠️ Фотографии не найдены."
+        # Добавляем футер с ссылками
+        text_no_photos_with_links = add_links_footer(text_no_photos)
+        
+        if edit_message_id:
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=edit_message_id,
+                text=text_no_photos_with_links,
+                parse_mode=ParseMode.HTML,
+                reply_markup=buttons.navigation_keyboard(include_masters_categories=True)
+            )
+        else:
+            await bot.send_message(
+                chat_id=chat_id,
+                text=text_no_photos_with_links,
+                parse_mode=ParseMode.HTML,
+                reply_markup=buttons.navigation_keyboard(include_masters_categories=True)
+            )
+        return
+    
+    # Получаем текущую фотографию
+    photo = photos[current_index]
+    
+    # Сохраняем ссылку на текущего мастера в состоянии
+    await state.update_data(current_master_id=photo.get('id'), current_photo_index=current_index)
+    
+    # Готовые подпись и клавиатура (клавиатура передается в Telegram как JSON)
+    card = await get_master_card(category, photos, current_index)
+    full_caption = card["caption"]
+    kb = card["keyboard"]
+    
+    if config.LAZY_MASTER_WORKS and config.LAZY_WORKS_PREFETCH > 0:
+        # Пока пользователь смотрит карточку, загружаем работы соседних мастеров
+        asyncio.create_task(prefetch_neighbour_works(category, photos, current_index))
+    
     try:
         # Если нам передали ID сообщения для редактирования
         if edit_message_id:
-            if len(full_caption) <= 1024:
+            if not card["long_caption"]:
                 # Редактируем существующее сообщение
-                await bot.edit_message_media(
+                await send_cached_photo(lambda media: bot.edit_message_media(
                     chat_id=chat_id,
                     message_id=edit_message_id,
                     media=types.InputMediaPhoto(
-                        media=photo['url'],
+                        media=media,
                         caption=full_caption,
                         parse_mode=ParseMode.HTML
                     ),
                     reply_markup=kb
-                )
+                ), photo['url'])
             else:
                 # Если подпись слишком длинная, редактируем без подписи
                 logger.info(f"Слишком длинная подпись для фото мастера: {len(full_caption)} символов. Отправляем только фото.")
-                await bot.edit_message_media(
+                await send_cached_photo(lambda media: bot.edit_message_media(
                     chat_id=chat_id,
                     message_id=edit_message_id,
                     media=types.InputMediaPhoto(
-                        media=photo['url']
+                        media=media
                     ),
                     reply_markup=kb
-                )
+                ), photo['url'])
                 # И отправляем текстовое сообщение отдельно
                 await bot.send_message(
                     chat_id=chat_id,
@@ -684,22 +1249,22 @@ async def send_master_photo(chat_id, state, edit_message_id=None):
                 )
         else:
             # Проверяем длину подписи
-            if len(full_caption) <= 1024:
-                await bot.send_photo(
+            if not card["long_caption"]:
+                await send_cached_photo(lambda media: bot.send_photo(
                     chat_id=chat_id,
-                    photo=photo['url'],
+                    photo=media,
                     caption=full_caption,
                     parse_mode=ParseMode.HTML,
                     reply_markup=kb
-                )
+                ), photo['url'])
             else:
                 # Если подпись слишком длинная, отправляем фото и текст отдельно
                 logger.info(f"Слишком длинная подпись для фото мастера: {len(full_caption)} символов. Отправляем фото и текст отдельно.")
-                await bot.send_photo(
+                await send_cached_photo(lambda media: bot.send_photo(
                     chat_id=chat_id,
-                    photo=photo['url'],
+                    photo=media,
                     reply_markup=kb
-                )
+                ), photo['url'])
                 await bot.send_message(
                     chat_id=chat_id,
                     text=full_caption,
@@ -728,20 +1293,104 @@ async def send_master_photo(chat_id, state, edit_message_id=None):
                     reply_markup=kb
                 )
         else:
-            await bot.send_message(
-                chat_id=chat_id,
-                text=f"⚠️ Не удалось загрузить фото мастера.\n\n{full_caption}",
-                parse_mode=ParseMode.HTML,
-                reply_markup=kb
-            )
+            await bot.send_message(
+                chat_id=chat_id,
+                text=f"⚠️ Не удалось загрузить фото мастера.\n\n{full_caption}",
+                parse_mode=ParseMode.HTML,
+                reply_markup=kb
+            )
+
+async def get_current_master_fio(data):
+    """ФИО текущего мастера (первая строка анкеты)"""
+    master_info = await get_current_master(data)
+    master_name = master_info.get('text', '').strip() if master_info else ''
+    
+    # Логируем информацию о мастере для отладки
+    logger.info(f"Информация о мастере: {master_name}")
+    
+    # Получаем первую строку из описания мастера (ФИО)
+    master_fio = master_name.split('\n')[0] if master_name and '\n' in master_name else master_name
+    
+    # Если ФИО пустое, используем значение по умолчанию
+    if not master_fio:
+        master_fio = "Неизвестный мастер"
+        logger.warning("ФИО мастера не найдено, используем значение по умолчанию")
+    return master_fio
+
+def master_work_caption(header, description):
+    """Подпись к фото работы, укороченная до лимита Telegram за счет описания"""
+    caption = f"{header}\n\n{description}" if header else description
+    overflow = len(caption) - config.CAPTION_LIMIT
+    if overflow > 0:
+        description = description[:max(len(description) - overflow - 1, 0)] + "…"
+        caption = f"{header}\n\n{description}" if header else description
+    return caption
+
+# Функция для отправки страницы работ мастера альбомом
+async def send_master_works_page(chat_id, state):
+    """Отправляет страницу работ мастера одним альбомом и сообщение с кнопкой «Показать ещё»"""
+    data = await state.get_data()
+    category = data.get('current_master_category', 'Мастера')
+    photos = await get_master_works(category, data.get('current_master_id'))
+    size = config.MEDIA_GROUP_SIZE
+    page_index = data.get('current_work_page', 0)
+    page = photos[page_index * size:(page_index + 1) * size]
+    
+    back_kb = InlineKeyboardMarkup(row_width=1)
+    back_kb.add(InlineKeyboardButton("◀️ Вернуться к анкете мастера", callback_data="back_to_master"))
+    
+    if not page:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=add_links_footer("⚠️ Фотографии работ не найдены."),
+            parse_mode=ParseMode.HTML,
+            reply_markup=back_kb
+        )
+        return
+    
+    # Заголовок с ФИО мастера ставится в подпись первого фото альбома
+    master_fio = await get_current_master_fio(data)
+    header = f"<b>🛠️ Работы мастера {master_fio} ({category})</b>"
+    captions = []
+    for i, photo in enumerate(page):
+        number = page_index * size + i + 1
+        description = photo.get('description') or f"Работа {number} из {len(photos)}"
+        captions.append(master_work_caption(header if i == 0 else None, description))
+    
+    try:
+        if len(page) > 1:
+            await send_cached_media_group(lambda media: bot.send_media_group(chat_id, [
+                types.InputMediaPhoto(media=ref, caption=caption, parse_mode=ParseMode.HTML)
+                for ref, caption in zip(media, captions)
+            ]), [photo['url'] for photo in page])
+        else:
+            await send_cached_photo(lambda media: bot.send_photo(
+                chat_id=chat_id, photo=media, caption=captions[0], parse_mode=ParseMode.HTML
+            ), page[0]['url'])
+    except exceptions.BadRequest as e:
+        # Альбом не принят - показываем первую работу страницы в режиме пролистывания
+        logger.warning(f"Не удалось отправить работы мастера альбомом: {e}")
+        await state.update_data(current_work_index=page_index * size)
+        await send_master_work_photo(chat_id, state)
+        return
+    
+    shown = min((page_index + 1) * size, len(photos))
+    if shown < len(photos):
+        back_kb.inline_keyboard.insert(0, [InlineKeyboardButton("Показать ещё", callback_data="works_more")])
+    await bot.send_message(
+        chat_id=chat_id,
+        text=add_links_footer(f"🛠️ Показано {shown} из {len(photos)} работ"),
+        parse_mode=ParseMode.HTML,
+        reply_markup=back_kb
+    )
 
 # Функция для отправки фотографии работ мастера с кнопками навигации
 async def send_master_work_photo(chat_id, state, edit_message_id=None):
     # Получаем данные из состояния
     data = await state.get_data()
-    photos = data.get('master_work_photos', [])
-    current_index = data.get('current_work_index', 0)
     category = data.get('current_master_category', 'Мастера')
+    photos = await get_master_works(category, data.get('current_master_id'))
+    current_index = min(data.get('current_work_index', 0), max(len(photos) - 1, 0))
     
     if not photos or len(photos) == 0:
         # Используем только InlineKeyboardMarkup вместо navigation_keyboard с категориями
@@ -772,20 +1421,7 @@ async def send_master_work_photo(chat_id, state, edit_message_id=None):
     # Получаем текущую фотографию
     photo = photos[current_index]
     
-    # Получаем информацию о мастере
-    master_info = data.get('master_info', {})
-    master_name = master_info.get('text', '').strip() if master_info else ''
-    
-    # Логируем информацию о мастере для отладки
-    logger.info(f"Информация о мастере в send_master_work_photo: {master_name}")
-    
-    # Получаем первую строку из описания мастера (ФИО)
-    master_fio = master_name.split('\n')[0] if master_name and '\n' in master_name else master_name
-    
-    # Если ФИО пустое, используем значение по умолчанию
-    if not master_fio:
-        master_fio = "Неизвестный мастер"
-        logger.warning("ФИО мастера не найдено, используем значение по умолчанию")
+    master_fio = await get_current_master_fio(data)
     
     # Формируем подпись
     caption = photo.get('description', '') if photo.get('description') else f"Работа {current_index+1} из {len(photos)}"
@@ -816,27 +1452,27 @@ async def send_master_work_photo(chat_id, state, edit_message_id=None):
         if edit_message_id:
             if len(full_caption) <= 1024:
                 # Редактируем существующее сообщение
-                await bot.edit_message_media(
+                await send_cached_photo(lambda media: bot.edit_message_media(
                     chat_id=chat_id,
                     message_id=edit_message_id,
                     media=types.InputMediaPhoto(
-                        media=photo['url'],
+                        media=media,
                         caption=full_caption,
                         parse_mode=ParseMode.HTML
                     ),
                     reply_markup=kb
-                )
+                ), photo['url'])
             else:
                 # Если подпись слишком длинная, редактируем без подписи
                 logger.info(f"Слишком длинная подпись для фото работы мастера: {len(full_caption)} символов. Отправляем только фото.")
-                await bot.edit_message_media(
+                await send_cached_photo(lambda media: bot.edit_message_media(
                     chat_id=chat_id,
                     message_id=edit_message_id,
                     media=types.InputMediaPhoto(
-                        media=photo['url']
+                        media=media
                     ),
                     reply_markup=kb
-                )
+                ), photo['url'])
                 # И отправляем текстовое сообщение отдельно
                 # Примечание: текстовое сообщение будет дублироваться при каждом пролистывании,
                 # но это неизбежно при редактировании медиа с длинным текстом
@@ -848,21 +1484,21 @@ async def send_master_work_photo(chat_id, state, edit_message_id=None):
         else:
             # Отправляем фото с подписью и с кнопками
             if len(full_caption) <= 1024:
-                await bot.send_photo(
+                await send_cached_photo(lambda media: bot.send_photo(
                     chat_id=chat_id,
-                    photo=photo['url'],
+                    photo=media,
                     caption=full_caption,
                     parse_mode=ParseMode.HTML,
                     reply_markup=kb
-                )
+                ), photo['url'])
             else:
                 # Если подпись слишком длинная, отправляем фото и текст отдельно
                 logger.info(f"Слишком длинная подпись для фото работы мастера: {len(full_caption)} символов. Отправляем фото и текст отдельно.")
-                await bot.send_photo(
+                await send_cached_photo(lambda media: bot.send_photo(
                     chat_id=chat_id,
-                    photo=photo['url'],
+                    photo=media,
                     reply_markup=kb
-                )
+                ), photo['url'])
                 await bot.send_message(
                     chat_id=chat_id,
                     text=full_caption,
@@ -900,12 +1536,12 @@ async def send_master_work_photo(chat_id, state, edit_message_id=None):
             )
 
 # Обработчик нажатия кнопки "Далее" в карусели работ мастера
-@dp.callback_query_handler(lambda c: c.data == "work_next", state=User.view_master_works)
+@router.callback("work_next", state=User.view_master_works)
 async def work_next_callback(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем данные из состояния
     data = await state.get_data()
     current_index = data.get('current_work_index', 0)
-    photos = data.get('master_work_photos', [])
+    photos = await get_master_works(data.get('current_master_category'), data.get('current_master_id'))
     
     # Увеличиваем индекс, если не последняя фотография
     if current_index < len(photos) - 1:
@@ -924,7 +1560,7 @@ async def work_next_callback(callback_query: types.CallbackQuery, state: FSMCont
     await callback_query.answer()
 
 # Обработчик нажатия кнопки "Назад" в карусели работ мастера
-@dp.callback_query_handler(lambda c: c.data == "work_prev", state=User.view_master_works)
+@router.callback("work_prev", state=User.view_master_works)
 async def work_prev_callback(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем данные из состояния
     data = await state.get_data()
@@ -946,54 +1582,51 @@ async def work_prev_callback(callback_query: types.CallbackQuery, state: FSMCont
     # Отвечаем на callback, чтобы убрать часики на кнопке
     await callback_query.answer()
 
+# Обработчик кнопки "Показать ещё" под альбомом работ мастера
+@router.callback("works_more", state=User.view_master_works)
+async def works_more_callback(callback_query: types.CallbackQuery, state: FSMContext):
+    await callback_query.answer()
+    
+    # Убираем кнопки с предыдущей страницы
+    try:
+        await callback_query.message.edit_reply_markup(reply_markup=None)
+    except exceptions.MessageNotModified:
+        pass
+    
+    # Следующая страница берется из уже загруженных работ мастера
+    data = await state.get_data()
+    page_index = data.get('current_work_page', 0) + 1
+    photos = await get_master_works(data.get('current_master_category'), data.get('current_master_id'))
+    if page_index * config.MEDIA_GROUP_SIZE >= len(photos):
+        return
+    
+    await state.update_data(current_work_page=page_index)
+    await send_master_works_page(callback_query.message.chat.id, state)
+
 # Обработчик нажатия на счетчик работ (ничего не делает)
-@dp.callback_query_handler(lambda c: c.data == "work_count", state=User.view_master_works)
+@router.callback("work_count", state=User.view_master_works)
 async def work_count_callback(callback_query: types.CallbackQuery):
     await callback_query.answer("Текущая позиция в галерее работ")
 
 # Обработчик нажатия кнопки "Вернуться к анкете мастера" в карусели работ
-@dp.callback_query_handler(lambda c: c.data == "back_to_master", state=User.view_master_works)
+@router.callback("back_to_master", state=User.view_master_works)
 async def back_to_master_callback(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем необходимые данные из текущего состояния
     data = await state.get_data()
     category = data.get('current_master_category', 'Мастера')
-    master_info = data.get('master_info', {})
+    master_id = data.get('current_master_id')
     
     # Удаляем предыдущее сообщение
     await callback_query.message.delete()
     
-    # Получаем фотографии мастера по категории
-    album_id = None
-    master_photos = []
+    # Получаем фотографии мастеров категории из кэша базы мастеров
+    master_photos = await get_master_photos(category)
     
-    # Сначала проверяем, есть ли фотографии в кэше
-    global non_empty_masters_cache
-    if non_empty_masters_cache and "master_photos" in non_empty_masters_cache and category in non_empty_masters_cache["master_photos"]:
-        master_photos = non_empty_masters_cache["master_photos"][category]
-        logger.info(f"Использую кэшированные фотографии мастеров для категории '{category}'")
-    else:
-        # Если нет, пробуем получить альбом через кэш категорий
-        if non_empty_masters_cache and "all_categories" in non_empty_masters_cache:
-            album_id = non_empty_masters_cache["all_categories"].get(category)
-        
-        if not album_id:
-            # Если не получилось, просто возвращаемся к категориям
-            await back_to_master_categories(callback_query.message, state)
-            await callback_query.answer()
-            return
-        
-        # Получаем фото мастера
-        await vk_api_rate_limit()
-        master_photos = await get_album_photos_async(config.VK_TOKEN, config.VK_GROUP_ID, album_id)
-        
-        # Сохраняем в кэш
-        if master_photos and len(master_photos) > 0:
-            if not non_empty_masters_cache:
-                non_empty_masters_cache = {}
-            if "master_photos" not in non_empty_masters_cache:
-                non_empty_masters_cache["master_photos"] = {}
-            non_empty_masters_cache["master_photos"][category] = master_photos
-            logger.info(f"Сохранил {len(master_photos)} фотографий мастеров в кэш для категории '{category}'")
+    if not master_photos:
+        # Если не получилось, просто возвращаемся к категориям
+        await back_to_master_categories(callback_query.message, state)
+        await callback_query.answer()
+        return
     
     # Очищаем все данные состояния
     await state.finish()
@@ -1001,24 +1634,14 @@ async def back_to_master_callback(callback_query: types.CallbackQuery, state: FS
     # Переходим обратно в состояние просмотра карусели мастеров
     await User.view_masters_carousel.set()
     
-    # Находим индекс мастера по его информации
-    current_photo_index = 0
-    if master_info and master_photos:
-        master_text = master_info.get('text', '')
-        for i, photo in enumerate(master_photos):
-            if photo.get('text') == master_text:
-                current_photo_index = i
-                break
-    
-    # Логируем информацию о мастере для отладки
-    logger.info(f"Информация о мастере при возврате: {master_info.get('text', 'Нет информации')}")
+    # Находим индекс мастера по его ID
+    current_photo_index = find_master_index(master_photos, master_id)
     
-    # Сохраняем данные для просмотра анкеты мастера, включая информацию о мастере
+    # Сохраняем ссылки для просмотра анкеты мастера
     await state.update_data(
         current_master_category=category,
-        master_photos=master_photos,
         current_photo_index=current_photo_index,
-        master_info=master_info
+        current_master_id=master_id
     )
     
     # Отправляем фото мастера
@@ -1029,15 +1652,125 @@ async def back_to_master_callback(callback_query: types.CallbackQuery, state: FS
 
 @cached
 async def get_market_items_async(token, owner_id, album_id, force_update=False):
-    # Применяем ограничение частоты запросов
-    await vk_api_rate_limit()
+    return await vk_async.get_market_item_info(token, owner_id, album_id)
+
+MARKET_END_TEXT = "🔍 <b>Просмотр товаров завершен.</b>\n\nВы можете выбрать другой магазин из списка или вернуться к категориям."
+
+def market_item_caption(item):
+    """Подпись товара маркета со ссылкой на товар в ВК"""
+    price_text = f"\n💰 {item.get('price')}" if item.get('price') else ""
+    caption = f"<b>🛒 {item['title']}</b>{price_text}\n\n{item['description']}"
+    if item.get('url'):
+        caption += f"\n\n<a href='{item['url']}'>Посмотреть в магазине ВКонтакте</a>"
+    return caption
+
+def market_item_short_caption(item):
+    """Подпись товара, укороченная до лимита Telegram за счет описания"""
+    caption = market_item_caption(item)
+    overflow = len(caption) - config.CAPTION_LIMIT
+    if overflow <= 0:
+        return caption
+    description = item['description'][:max(len(item['description']) - overflow - 1, 0)] + "…"
+    return market_item_caption(dict(item, description=description))
+
+# Готовые страницы товаров маркета: {ID категории: (список товаров, страницы)}
+market_pages_cache = {}
+
+def build_market_pages(items):
+    """Разбивает товары на страницы по MEDIA_GROUP_SIZE с готовыми подписями"""
+    entries = [{"item": item, "caption": market_item_short_caption(item)} for item in items]
+    size = config.MEDIA_GROUP_SIZE
+    return [entries[i:i + size] for i in range(0, len(entries), size)]
+
+async def get_market_pages(album_id):
+    """Возвращает страницы товаров категории (перестраиваются, только когда обновился список товаров)"""
+    items = await get_market_items_async(config.VK_TOKEN, config.VK_GROUP_ID, album_id)
+    entry = market_pages_cache.get(album_id)
+    if entry is None or entry[0] is not items:
+        entry = (items, build_market_pages(items or []))
+        market_pages_cache[album_id] = entry
+    return entry[1]
+
+async def send_market_item(message, item):
+    """Отправляет один товар маркета отдельным сообщением"""
+    price_text = f"\n💰 {item.get('price')}" if item.get('price') else ""
+    caption = add_links_footer(market_item_caption(item))
+    try:
+        # Используем нашу функцию для отправки фото с ссылками
+        await send_photo_with_links(message, photo=item['photo'], caption=caption, parse_mode=ParseMode.HTML)
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"Ошибка при отправке информации о товаре '{item.get('title')}': {error_msg}")
     
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, vk.get_market_item_info, token, owner_id, album_id)
+        # Обработка ошибок, связанных с фото
+        if "Bad Request" in error_msg and ("Wrong file identifier" in error_msg or "PHOTO_INVALID_DIMENSIONS" in error_msg):
+            logger.warning(f"Проблема с фото товара '{item.get('title')}': {error_msg}")
+            await message.answer(
+                f"<b>🛒 {item['title']}</b>{price_text}\n\n{item['description']}"
+                f"\n\n⚠️ Не удалось загрузить изображение товара.", 
+                parse_mode=ParseMode.HTML
+            )
+        elif "Message caption is too long" in error_msg:
+            # Обработка ошибки с длинной подписью, если проверка выше не сработала
+            logger.warning(f"Слишком длинная подпись для товара '{item.get('title')}'")
+            try:
+                await message.answer_photo(photo=item['photo'])
+                await message.answer(caption, parse_mode=ParseMode.HTML)
+            except Exception as inner_e:
+                logger.error(f"Повторная ошибка при отправке информации о товаре: {inner_e}")
+                await message.answer(f"<b>🛒 {item['title']}</b>\n\n{item['description']}", 
+                                 parse_mode=ParseMode.HTML)
+        else:
+            # Общая обработка ошибок
+            try:
+                await message.answer_photo(photo=item['photo'])
+                await message.answer(f"<b>🛒 {item['title']}</b>\n\n{item['description']}", 
+                                    parse_mode=ParseMode.HTML)
+            except:
+                await message.answer(f"⚠️ Не удалось загрузить информацию о товаре: {item['title']}")
+
+async def send_market_page(message, pages, page_index):
+    """Отправляет страницу товаров одним альбомом и сообщение с кнопкой «Показать ещё»"""
+    page = pages[page_index]
+    with_photo = [entry for entry in page if entry["item"].get('photo')]
+    without_photo = [entry for entry in page if not entry["item"].get('photo')]
+    
+    try:
+        if len(with_photo) > 1:
+            await send_cached_media_group(lambda media: message.answer_media_group([
+                types.InputMediaPhoto(media=ref, caption=entry["caption"], parse_mode=ParseMode.HTML)
+                for ref, entry in zip(media, with_photo)
+            ]), [entry["item"]['photo'] for entry in with_photo])
+        elif with_photo:
+            await send_cached_photo(lambda media: message.answer_photo(
+                photo=media, caption=with_photo[0]["caption"], parse_mode=ParseMode.HTML
+            ), with_photo[0]["item"]['photo'])
+    except exceptions.BadRequest as e:
+        # Альбом не принят (например, из-за одного фото) - отправляем товары страницы по одному
+        logger.warning(f"Не удалось отправить страницу товаров альбомом: {e}")
+        with bulk_sends():
+            for entry in with_photo:
+                await send_market_item(message, entry["item"])
+    
+    for entry in without_photo:
+        await message.answer(entry["caption"], parse_mode=ParseMode.HTML)
+    
+    total = sum(len(p) for p in pages)
+    shown = sum(len(p) for p in pages[:page_index + 1])
+    if page_index + 1 < len(pages):
+        kb = InlineKeyboardMarkup().add(InlineKeyboardButton("Показать ещё", callback_data="market_more"))
+        await send_message_with_links(
+            message,
+            f"🛒 Показано {shown} из {total} товаров",
+            parse_mode=ParseMode.HTML,
+            reply_markup=kb
+        )
+    else:
+        await send_message_with_links(message, MARKET_END_TEXT, parse_mode=ParseMode.HTML)
 
-@dp.message_handler(state=User.get_shop)
+@router.message(state=User.get_shop)
 async def show_shop(message: types.Message, state: FSMContext):
-    data = await state.get_data()
+    data = await get_market_categories_async(config.VK_TOKEN, config.VK_GROUP_ID) or {}
     if message.text not in data and message.text.replace('🛒 ', '') not in data:
         await message.answer("⚠️ Извините, такой категории не найдено. Выберите категорию из списка ниже.", 
                              reply_markup=buttons.generator(data.keys()))
@@ -1051,6 +1784,19 @@ async def show_shop(message: types.Message, state: FSMContext):
             break
         
     current = data.get(category, data.get(message.text))
+    
+    if config.MARKET_MEDIA_GROUPS:
+        # Товары показываются страницами-альбомами, курсор страницы хранится в состоянии
+        pages = await get_market_pages(current)
+        if not pages:
+            await message.answer("⚠️ К сожалению, товары не найдены", 
+                                reply_markup=buttons.go_back())
+            return
+        
+        await state.update_data(market_album=current, market_page=0)
+        await send_market_page(message, pages, 0)
+        return
+    
     await message.answer(f"🔍 <b>Загружаю информацию о товарах категории:</b> {category}...", 
                           parse_mode=ParseMode.HTML)
                           
@@ -1061,71 +1807,42 @@ async def show_shop(message: types.Message, state: FSMContext):
                             reply_markup=buttons.go_back())
         return
         
-    for i, item in enumerate(items):
-        try:
-            # Добавляем ссылку на товар в текст
-            item_url = item.get('url', '')
-            price_text = f"\n💰 {item.get('price')}" if item.get('price') else ""
-            
-            caption = f"<b>🛒 {item['title']}</b>{price_text}\n\n{item['description']}"
-            if item_url:
-                caption += f"\n\n<a href='{item_url}'>Посмотреть в магазине ВКонтакте</a>"
-            
-            # Добавляем ссылки на все ресурсы
-            caption = add_links_footer(caption)
-            
-            # Используем нашу функцию для отправки фото с ссылками
-            await send_photo_with_links(message, photo=item['photo'], caption=caption, parse_mode=ParseMode.HTML)
-            
-            # Небольшая задержка между сообщениями
-            await asyncio.sleep(0.3)
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Ошибка при отправке информации о товаре '{item.get('title')}': {error_msg}")
-            
-            # Обработка ошибок, связанных с фото
-            if "Bad Request" in error_msg and ("Wrong file identifier" in error_msg or "PHOTO_INVALID_DIMENSIONS" in error_msg):
-                logger.warning(f"Проблема с фото товара '{item.get('title')}': {error_msg}")
-                await message.answer(
-                    f"<b>🛒 {item['title']}</b>{price_text}\n\n{item['description']}"
-                    f"\n\n⚠️ Не удалось загрузить изображение товара.", 
-                    parse_mode=ParseMode.HTML
-                )
-            elif "Message caption is too long" in error_msg:
-                # Обработка ошибки с длинной подписью, если проверка выше не сработала
-                logger.warning(f"Слишком длинная подпись для товара '{item.get('title')}'")
-                try:
-                    await message.answer_photo(photo=item['photo'])
-                    await message.answer(caption, parse_mode=ParseMode.HTML)
-                except Exception as inner_e:
-                    logger.error(f"Повторная ошибка при отправке информации о товаре: {inner_e}")
-                    await message.answer(f"<b>🛒 {item['title']}</b>\n\n{item['description']}", 
-                                     parse_mode=ParseMode.HTML)
-            else:
-                # Общая обработка ошибок
-                try:
-                    await message.answer_photo(photo=item['photo'])
-                    await message.answer(f"<b>🛒 {item['title']}</b>\n\n{item['description']}", 
-                                        parse_mode=ParseMode.HTML)
-                except:
-                    await message.answer(f"⚠️ Не удалось загрузить информацию о товаре: {item['title']}")
+    # Товары отправляются с низким приоритетом, темп задает планировщик отправки
+    with bulk_sends():
+        for item in items:
+            await send_market_item(message, item)
 
     # После отправки всех товаров показываем сообщение о завершении просмотра
-    await message.answer(
-        f"🔍 <b>Просмотр товаров завершен.</b>\n\nВы можете выбрать другой магазин из списка или вернуться к категориям.", 
-        parse_mode=ParseMode.HTML
-    )
+    await message.answer(MARKET_END_TEXT, parse_mode=ParseMode.HTML)
+
+# Обработчик кнопки "Показать ещё" под страницей товаров маркета
+@router.callback("market_more", state=User.get_shop)
+async def market_more_callback(callback_query: types.CallbackQuery, state: FSMContext):
+    await callback_query.answer()
+    
+    data = await state.get_data()
+    album_id = data.get('market_album')
+    page_index = data.get('market_page', 0) + 1
+    pages = await get_market_pages(album_id) if album_id else []
+    
+    # Убираем кнопку с предыдущей страницы
+    try:
+        await callback_query.message.edit_reply_markup(reply_markup=None)
+    except exceptions.MessageNotModified:
+        pass
+    
+    if page_index >= len(pages):
+        return
+    
+    await state.update_data(market_page=page_index)
+    await send_market_page(callback_query.message, pages, page_index)
 
 @cached
 async def get_album_names_async(token, group_id, force_update=False):
-    # Применяем ограничение частоты запросов
-    await vk_api_rate_limit()
-    
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, vk.get_album_names, token, group_id)
+    return await vk_async.get_album_names(token, group_id)
 
 # Обработчик для кнопки "База мастеров СФБ"
-@dp.message_handler(lambda m: m.text == "👷‍♂️ База мастеров СФБ" or m.text == "База мастеров СФБ")
+@router.message("👷‍♂️ База мастеров СФБ", "База мастеров СФБ")
 async def masters_sfb_message(message: types.Message, state: FSMContext):
     await masters_sfb_button_handler(message)
 
@@ -1147,8 +1864,10 @@ async def masters_sfb_handler(message, state: FSMContext):
     global non_empty_masters_cache, non_empty_masters_cache_time
     current_time = time.time()
     
-    # Проверяем, есть ли актуальный кэш непустых категорий
-    if non_empty_masters_cache and current_time - non_empty_masters_cache_time < config.CACHE_TIME:
+    # Проверяем, есть ли кэш непустых категорий (устаревший кэш обновляется в фоне плановым обновлением)
+    if non_empty_masters_cache:
+        if current_time - non_empty_masters_cache_time >= config.CACHE_TIME:
+            logger.info("Кэш категорий мастеров устарел, используем его до фонового обновления")
         logger.info("Используем кэш категорий мастеров")
         category_buttons = non_empty_masters_cache.get("buttons", [])
         all_categories = non_empty_masters_cache.get("all_categories", {})
@@ -1183,27 +1902,20 @@ async def masters_sfb_handler(message, state: FSMContext):
                         parse_mode=ParseMode.HTML,
                         reply_markup=kb)
     await User.get_master.set()
-    await state.set_data(all_categories)
+    # Категории берутся из общего кэша, в состоянии ничего не храним
+    await state.reset_data()
 
 @cached
 async def get_market_categories_async(token, group_id, force_update=False):
-    # Применяем ограничение частоты запросов
-    await vk_api_rate_limit()
-    
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, vk.get_market_items, token, group_id)
+    return await vk_async.get_market_items(token, group_id)
 
 @cached
 async def get_shop_list_async(token, group_id, force_update=False):
     """Асинхронная обертка для получения списка магазинов"""
-    # Применяем ограничение частоты запросов
-    await vk_api_rate_limit()
-    
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, vk.get_shop_list, token, group_id)
+    return await vk_async.get_shop_list(token, group_id)
 
 # Обработчик для кнопки "Магазины-партнеры СФБ"
-@dp.message_handler(lambda m: m.text == "🏪 Магазины-партнеры СФБ" or m.text == "Магазины-партнеры СФБ")
+@router.message("🏪 Магазины-партнеры СФБ", "Магазины-партнеры СФБ")
 async def partners_stores_message(message: types.Message, state: FSMContext):
     await partners_stores_handler(message, state)
 
@@ -1218,11 +1930,7 @@ async def partners_stores_handler(message, state: FSMContext):
     if not shops_categories_cache:
         # Если кэша нет, запускаем загрузку
         logger.info("Кэш магазинов пуст, загружаем данные")
-        shop_categories = await get_shop_list_async(config.VK_TOKEN, config.VK_GROUP_ID)
-        
-        # Сохраняем результаты в кэш
-        shops_categories_cache = shop_categories
-        shops_categories_cache_time = time.time()
+        shop_categories = await get_shop_catalog()
     else:
         logger.info("Используем существующий кэш категорий магазинов")
         shop_categories = shops_categories_cache
@@ -1269,43 +1977,18 @@ async def partners_stores_handler(message, state: FSMContext):
                         parse_mode=ParseMode.HTML,
                         reply_markup=kb)
     await User.get_shop_category.set()
-    await state.set_data(shop_categories)
+    # Каталог магазинов берется из общего кэша, в состоянии ничего не храним
+    await state.reset_data()
 
 # Обработчик для выбора категории магазинов
-@dp.message_handler(state=User.get_shop_category)
+@router.message(state=User.get_shop_category)
 async def show_shops_by_category(message: types.Message, state: FSMContext):
-    shop_categories = await state.get_data()
-    
-    # Выводим для отладки
-    logger.info(f"Полученный текст категории: {message.text}")
-    logger.info(f"Доступные категории: {[k for k in shop_categories.keys() if k != 'all_shops']}")
-    
-    # Находим выбранную категорию - убираем эмодзи и счетчик [N]
-    category_name = message.text
-    
-    # Убираем счетчик количества в формате [N]
-    if ' [' in category_name and category_name.endswith(']'):
-        category_name = category_name.split(' [')[0]
+    shop_categories = await get_shop_catalog()
     
-    # Убираем эмодзи, если есть
-    if '📋 ' in category_name:
-        category_name = category_name.replace('📋 ', '')
-    
-    # Ищем категорию с учетом эмодзи и без
-    found_category = None
-    for cat in shop_categories.keys():
-        if cat == category_name or cat == category_name.strip():
-            found_category = cat
-            break
-        # Убираем эмодзи из названия категории для сравнения
-        no_emoji_cat = cat
-        for emoji in ["🏪", "🧱", "🔨", "🪑", "🌱", "🚿", "🔌", "🏡"]:
-            if cat.startswith(emoji + " "):
-                no_emoji_cat = cat[len(emoji) + 1:]
-                break
-        if no_emoji_cat == category_name or no_emoji_cat.strip() == category_name.strip():
-            found_category = cat
-            break
+    # Находим выбранную категорию по нормализованному тексту кнопки
+    found_category = name_indexes.find("shop_categories", shop_categories, message.text)
+    if found_category == "all_shops":
+        found_category = None
     
     # Если категория не найдена
     if not found_category:
@@ -1343,7 +2026,7 @@ async def show_shops_by_category(message: types.Message, state: FSMContext):
     await User.get_shop_info.set()
 
 # Обработчик для возврата к списку магазинов
-@dp.message_handler(lambda m: m.text == "◀️ Вернуться к списку магазинов", state=User.get_shop_info)
+@router.message("◀️ Вернуться к списку магазинов", state=User.get_shop_info)
 async def back_to_shops_list(message: types.Message, state: FSMContext):
     data = await state.get_data()
     current_category = data.get('current_category')
@@ -1355,8 +2038,8 @@ async def back_to_shops_list(message: types.Message, state: FSMContext):
         await state.finish()
         return
     
-    # Получаем магазины текущей категории
-    shops = data[current_category]
+    # Получаем магазины текущей категории из общего каталога
+    shops = (await get_shop_catalog()).get(current_category, {})
     
     # Если список магазинов пуст, возвращаемся к категориям
     if not shops:
@@ -1379,7 +2062,7 @@ async def back_to_shops_list(message: types.Message, state: FSMContext):
     # Данные состояния не меняются, так как мы остаемся в той же категории
 
 # Обработчик для возврата к категориям магазинов
-@dp.message_handler(lambda m: m.text == "◀️ Вернуться к категориям магазинов", state=User.get_shop_info)
+@router.message("◀️ Вернуться к категориям магазинов", state=User.get_shop_info)
 async def back_to_shop_categories(message: types.Message, state: FSMContext):
     # Показываем пользователю сообщение о загрузке
     loading_message = await message.answer("🔄 <b>Загружаю категории магазинов...</b>\n\nПожалуйста, подождите.", parse_mode=ParseMode.HTML)
@@ -1387,18 +2070,16 @@ async def back_to_shop_categories(message: types.Message, state: FSMContext):
     global shops_categories_cache, shops_categories_cache_time
     current_time = time.time()
     
-    # Проверяем, есть ли актуальный кэш категорий магазинов
-    if shops_categories_cache and current_time - shops_categories_cache_time < config.CACHE_TIME:
+    # Проверяем, есть ли кэш категорий магазинов (устаревший кэш обновляется в фоне плановым обновлением)
+    if shops_categories_cache:
+        if current_time - shops_categories_cache_time >= config.CACHE_TIME:
+            logger.info("Кэш категорий магазинов устарел, используем его до фонового обновления")
         logger.info("Используем кэш категорий магазинов при возврате")
         shop_categories = shops_categories_cache
     else:
-        # Если кэш устарел, обновляем данные
-        logger.info("Обновляем кэш категорий магазинов при возврате")
-        shop_categories = await get_shop_list_async(config.VK_TOKEN, config.VK_GROUP_ID)
-        
-        # Сохраняем результаты в кэш
-        shops_categories_cache = shop_categories
-        shops_categories_cache_time = current_time
+        # Если кэша нет, загружаем данные
+        logger.info("Загружаем категории магазинов при возврате")
+        shop_categories = await get_shop_catalog()
     
     # Удаляем сообщение о загрузке
     await loading_message.delete()
@@ -1443,12 +2124,12 @@ async def back_to_shop_categories(message: types.Message, state: FSMContext):
                         parse_mode=ParseMode.HTML,
                         reply_markup=kb)
     
-    # Сохраняем новые данные в состояние
-    await state.set_data(shop_categories)
+    # Каталог магазинов берется из общего кэша, в состоянии ничего не храним
+    await state.reset_data()
     await User.get_shop_category.set()
 
 # Обработчик для выбора конкретного магазина из списка
-@dp.message_handler(state=User.get_shop_info)
+@router.message(state=User.get_shop_info)
 async def show_shop_info(message: types.Message, state: FSMContext):
     data = await state.get_data()
     current_category = data.get('current_category')
@@ -1460,8 +2141,8 @@ async def show_shop_info(message: types.Message, state: FSMContext):
         await back_to_shop_categories(message, state)
         return
     
-    # Получаем список магазинов для текущей категории
-    shops = data.get(current_category, {})
+    # Получаем список магазинов для текущей категории из общего каталога
+    shops = (await get_shop_catalog()).get(current_category, {})
     
     # Если список магазинов пуст, возвращаемся к выбору категорий
     if not shops:
@@ -1472,42 +2153,13 @@ async def show_shop_info(message: types.Message, state: FSMContext):
         await back_to_shop_categories(message, state)
         return
     
-    # Находим выбранный магазин - убираем эмодзи
+    # Находим выбранный магазин по нормализованному тексту кнопки
     shop_name = message.text
-    if shop_name.startswith('📋 '):
-        shop_name = shop_name.replace('📋 ', '')
-    if shop_name.startswith('🏪 '):
-        shop_name = shop_name.replace('🏪 ', '')
-    
-    # Ищем магазин с учетом эмодзи и без
-    found_shop = None
-    for shop_key in shops.keys():
-        # Прямое сравнение
-        if shop_key == shop_name:
-            found_shop = shop_key
-            break
-        # Сравнение без эмодзи
-        if shop_key.startswith('🏪 ') and shop_key[2:] == shop_name:
-            found_shop = shop_key
-            break
-        if shop_key.startswith('📋 ') and shop_key[2:] == shop_name:
-            found_shop = shop_key
-            break
-        # Сравнение названий без учета пробелов и регистра
-        if shop_key.lower().strip() == shop_name.lower().strip():
-            found_shop = shop_key
-            break
-        # Сравнение без эмодзи, пробелов и регистра
-        if shop_key.startswith('🏪 ') and shop_key[2:].lower().strip() == shop_name.lower().strip():
-            found_shop = shop_key
-            break
-        if shop_key.startswith('📋 ') and shop_key[2:].lower().strip() == shop_name.lower().strip():
-            found_shop = shop_key
-            break
+    found_shop = name_indexes.find(f"shops:{current_category}", shops, shop_name)
     
     # Если магазин не найден
     if not found_shop:
-        logger.warning(f"Магазин не найден: '{shop_name}'. Доступные магазины: {list(shops.keys())}")
+        logger.warning(f"Магазин не найден: '{shop_name}'")
         # Отправляем сообщение с тем же списком магазинов
         kb = buttons.generator_with_categories_button(shops.keys(), row_width=1, force_single_column=True, preserve_emoji=True)
         await message.answer(
@@ -1582,10 +2234,10 @@ async def show_shop_info(message: types.Message, state: FSMContext):
         
         try:
             # Отправляем фото без подписи
-            await message.answer_photo(
-                photo=photo_url,
+            await send_cached_photo(lambda media: message.answer_photo(
+                photo=media,
                 parse_mode=ParseMode.HTML
-            )
+            ), photo_url)
             
             # Отправляем информацию отдельным сообщением с добавлением ссылок
             shop_info = add_links_footer(shop_info)
@@ -1611,12 +2263,12 @@ async def show_shop_info(message: types.Message, state: FSMContext):
     
     # Если подпись не слишком длинная, отправляем фото с подписью
     try:
-        await message.answer_photo(
-            photo=photo_url,
+        await send_cached_photo(lambda media: message.answer_photo(
+            photo=media,
             caption=shop_info,
             parse_mode=ParseMode.HTML,
             reply_markup=kb
-        )
+        ), photo_url)
         logger.info(f"Успешно отправлено фото магазина: {shop['title']}")
     except Exception as e:
         error_msg = str(e)
@@ -1641,7 +2293,7 @@ async def show_shop_info(message: types.Message, state: FSMContext):
             # Дополнительная проверка на случай, если предыдущая проверка длины не сработала
             logger.warning(f"Слишком длинная подпись для фото (обработка исключения): {len(shop_info)}")
             try:
-                await message.answer_photo(photo=photo_url)
+                await send_cached_photo(lambda media: message.answer_photo(photo=media), photo_url)
                 await message.answer(shop_info, parse_mode=ParseMode.HTML, reply_markup=kb)
             except Exception as inner_e:
                 logger.error(f"Повторная ошибка при отправке фото и текста магазина: {inner_e}")
@@ -1657,7 +2309,7 @@ async def show_shop_info(message: types.Message, state: FSMContext):
 
 
 # Обработчик для кнопки "Предложить запись"
-@dp.message_handler(lambda m: m.text == "📝 Предложить запись" or m.text == "Предложить запись")
+@router.message("📝 Предложить запись", "Предложить запись")
 async def offer_post_message(message: types.Message):
     await message.answer(
         "📝 <b>Предложить запись в сообществе</b>\n\n"
@@ -1668,159 +2320,29 @@ async def offer_post_message(message: types.Message):
     )
 
 # Обработчик для кнопки "Стать магазином-партнером"
-@dp.message_handler(lambda m: m.text == "🤝 Стать магазином-партнером" or m.text == "Стать магазином-партнером")
+@router.message("🤝 Стать магазином-партнером", "Стать магазином-партнером")
 async def vk_partner_handler(message: types.Message):
-    # Показываем пользователю сообщение о загрузке
-    loading_message = await message.answer("🔄 <b>Загружаю информацию из ВКонтакте...</b>\n\nПожалуйста, подождите.", parse_mode=ParseMode.HTML)
-    
-    # Извлекаем topic_id из URL
-    topic_url = config.VK_PARTNER_TOPIC_URL
-    topic_id = None
-    
-    try:
-        # URL имеет формат https://vk.com/topic-GROUP_ID_TOPIC_ID
-        parts = topic_url.split("topic-")
-        if len(parts) > 1:
-            parts = parts[1].split("_")
-            if len(parts) > 1:
-                topic_id = parts[1]
-    except Exception as e:
-        logger.error(f"Ошибка при извлечении ID темы из URL {topic_url}: {e}")
-    
-    # Если не удалось извлечь topic_id, используем значение по умолчанию
-    if not topic_id:
-        # ID темы задан в URL после topic-GROUP_ID_TOPIC_ID
-        # Например, из https://vk.com/topic-95855103_49010445 извлекаем 49010445
-        topic_id = "49010445"  # Значение по умолчанию
-    
-    # Извлекаем group_id из конфигурации
-    group_id = str(config.VK_GROUP_ID).replace("-", "")
-    
-    # Получаем информацию о теме
-    topic_info = None
-    
-    try:
-        topic_info = await get_topic_info_async(config.VK_TOKEN, group_id, topic_id)
-    except Exception as e:
-        logger.error(f"Ошибка при получении данных из темы VK: {e}")
-    
-    # Формируем текст сообщения
-    text_message = "🤝 <b>Стать магазином-партнером</b>\n\n"
-    
-    # Добавляем информацию из темы, если она доступна
-    if topic_info:
-        # Используем заголовок темы, если он есть
-        if topic_info["title"] and topic_info["title"] != "Без названия":
-            text_message = f"🤝 <b>{topic_info['title']}</b>\n\n"
-        
-        # Если есть текст первого сообщения, добавляем его полностью
-        if topic_info["text"]:
-            topic_text = topic_info["text"]
-            text_message += f"{topic_text}\n\n"
-    else:
-        text_message += "Чтобы стать магазином-партнером, перейдите по ссылке ниже и оставьте заявку:\n"
-    
-    # Добавляем ссылку на тему
-    text_message += f"<a href='{config.VK_PARTNER_TOPIC_URL}'>Оставить заявку в ВКонтакте</a>"
-    
-    # Удаляем сообщение о загрузке
-    await loading_message.delete()
-    
-    # Отправляем сообщение с добавлением ссылок на ресурсы
+    # Экран подготовлен заранее и обновляется в фоне, запросов к ВК здесь нет
     await send_message_with_links(
         message,
-        text_message,
+        get_static_screen("partner"),
         parse_mode=ParseMode.HTML,
         reply_markup=buttons.go_back()
     )
 
 # Обработчик для кнопки "Попасть в базу мастеров"
-@dp.message_handler(lambda m: m.text == "📋 Попасть в базу мастеров" or m.text == "Попасть в базу мастеров")
+@router.message("📋 Попасть в базу мастеров", "Попасть в базу мастеров")
 async def vk_master_handler(message: types.Message):
-    # Показываем пользователю сообщение о загрузке
-    loading_message = await message.answer("🔄 <b>Загружаю информацию из ВКонтакте...</b>\n\nПожалуйста, подождите.", parse_mode=ParseMode.HTML)
-    
-    # Проверяем есть ли кэш категорий для информационного сообщения
-    global non_empty_masters_cache
-    
-    # Убираем вывод списка категорий, чтобы уместилась информация из ВК
-    category_info = ""
-    
-    # Извлекаем topic_id из URL
-    topic_url = config.VK_MASTER_TOPIC_URL
-    topic_id = None
-    
-    try:
-        # URL имеет формат https://vk.com/topic-GROUP_ID_TOPIC_ID
-        parts = topic_url.split("topic-")
-        if len(parts) > 1:
-            parts = parts[1].split("_")
-            if len(parts) > 1:
-                topic_id = parts[1]
-    except Exception as e:
-        logger.error(f"Ошибка при извлечении ID темы из URL {topic_url}: {e}")
-    
-    # Если не удалось извлечь topic_id, используем значение из конфигурации
-    if not topic_id:
-        # ID темы задан в URL после topic-GROUP_ID_TOPIC_ID
-        # Например, из https://vk.com/topic-95855103_49010449 извлекаем 49010449
-        topic_id = "49010449"  # Значение по умолчанию
-    
-    # Извлекаем group_id из конфигурации
-    group_id = str(config.VK_GROUP_ID).replace("-", "")
-    
-    # Получаем информацию о теме
-    topic_info = None
-    
-    try:
-        topic_info = await get_topic_info_async(config.VK_TOKEN, group_id, topic_id)
-    except Exception as e:
-        logger.error(f"Ошибка при получении данных из темы VK: {e}")
-    
-    # Формируем основной текст сообщения
-    text_message = "📋 <b>Хочу в базу мастеров и спецтехники</b>\n\n"
-    
-    # Добавляем информацию из темы, если она доступна
-    if topic_info:
-        # Используем заголовок темы, если он есть
-        if topic_info["title"] and topic_info["title"] != "Без названия":
-            text_message = f"📋 <b>{topic_info['title']}</b>\n\n"
-    
-    text_message += (
-        "Чтобы попасть в базу мастеров:\n\n"
-        "1️⃣ Подготовьте фотографию с информацией о ваших услугах\n"
-        "2️⃣ Укажите категорию услуг\n"
-        "3️⃣ Оставьте заявку по ссылке"
-    )
-    
-    # Добавляем категории, если они есть
-    if category_info:
-        text_message += category_info
-    
-    # Добавляем ссылку на тему
-    text_message += f"\n\n<a href='{config.VK_MASTER_TOPIC_URL}'>Оставить заявку в ВКонтакте</a>"
-    
-    # Используем полное первое сообщение из темы, если оно доступно
-    if topic_info and topic_info.get("text"):
-        # Форматируем и добавляем полный текст первого сообщения темы
-        topic_text = topic_info.get("text", "")
-        
-        # Добавляем текст с правильным форматированием для Telegram
-        text_message += f"\n\n{topic_text}"
-    
-    # Удаляем сообщение о загрузке
-    await loading_message.delete()
-    
-    # Отправляем сообщение с добавлением ссылок на ресурсы
+    # Экран подготовлен заранее и обновляется в фоне, запросов к ВК здесь нет
     await send_message_with_links(
         message,
-        text_message,
+        get_static_screen("master"),
         parse_mode=ParseMode.HTML,
         reply_markup=buttons.go_back()
     )
 
 # Обработчик для кнопки "Стена сообщества"
-@dp.message_handler(lambda m: m.text == "📰 Стена сообщества" or m.text == "Стена сообщества")
+@router.message("📰 Стена сообщества", "Стена сообщества")
 async def community_wall_handler(message: types.Message):
     text_message = (
         "📰 <b>Стена сообщества</b>\n\n"
@@ -1852,7 +2374,7 @@ async def cache_status_command(message: types.Message):
         age_hours = age // 3600
         age_minutes = (age % 3600) // 60
         age_seconds = age % 60
-        expires_in = max(0, config.CACHE_TIME - age)
+        expires_in = max(0, cache_entry["ttl"] - age)
         expires_hours = expires_in // 3600
         expires_minutes = (expires_in % 3600) // 60
         expires_seconds = expires_in % 60
@@ -1861,7 +2383,7 @@ async def cache_status_command(message: types.Message):
             'key': func_name,
             'age': f"{int(age_hours)}ч {int(age_minutes)}м {int(age_seconds)}с",
             'expires': f"{int(expires_hours)}ч {int(expires_minutes)}м {int(expires_seconds)}с",
-            'expired': age > config.CACHE_TIME
+            'expired': age > cache_entry["ttl"]
         })
     
     # Добавляем информацию о кэше категорий мастеров
@@ -1943,6 +2465,30 @@ async def cache_status_command(message: types.Message):
         cache_status += "\n"
     
     cache_status += f"\n📁 Всего записей в кэше: {len(cache_info)}\n"
+    
+    # Добавляем статистику кэша запросов
+    engine_stats = cache.stats()
+    cache_status += f"💾 Кэш запросов: {engine_stats['bytes'] / 1024 / 1024:.1f} из {engine_stats['max_bytes'] / 1024 / 1024:.0f} МБ, записей: {engine_stats['entries']}\n"
+    cache_status += f"🎯 Попадания: {engine_stats['hit_ratio'] * 100:.1f}% ({engine_stats['hits']} свежих, {engine_stats['stale_hits']} устаревших, {engine_stats['misses']} промахов)\n"
+    cache_status += f"🗑 Вытеснено записей: {engine_stats['evictions']}, не помещено: {engine_stats['rejected']}\n"
+    
+    # Добавляем статистику кэша file_id фотографий
+    file_id_stats = file_ids.stats()
+    cache_status += f"🖼 file_id фотографий: {file_id_stats['size']}, повторных отправок: {file_id_stats['hits']}, загрузок по URL: {file_id_stats['misses']}\n"
+    
+    # Добавляем статистику ожидания лимитера запросов к ВК
+    limiter_stats = vk_async.get_limiter_stats()
+    if limiter_stats:
+        cache_status += "🚦 Ожидание лимитера ВК:\n"
+        for method, stats in sorted(limiter_stats.items()):
+            cache_status += f"- {method}: {stats['count']} запросов, среднее {stats['avg']:.2f} сек, максимум {stats['max']:.2f} сек\n"
+    
+    # Добавляем статистику планировщика отправки сообщений Telegram
+    send_stats = bot.scheduler.stats()
+    cache_status += f"📤 Отправка в Telegram: {send_stats['retries']} повторов после RetryAfter, активных чатов {send_stats['chats']}\n"
+    for priority, stats in send_stats["waits"].items():
+        if stats['count']:
+            cache_status += f"- {priority}: {stats['count']} сообщений, среднее ожидание {stats['avg']:.2f} сек, максимум {stats['max']:.2f} сек\n"
     cache_status += f"⏰ Время жизни кэша: {config.CACHE_TIME // 3600} часов\n\n"
     cache_status += "Используйте /update_cache для принудительного обновления кэша."
     
@@ -1954,16 +2500,21 @@ async def update_cache_command(message: types.Message):
     if str(message.from_user.id) not in config.ADMIN_IDS.split(','):
         await message.answer("⚠️ У вас нет прав для выполнения этой команды.")
         return
+    
+    if config.BOT_ROLE == 'worker':
+        # В кластере каталог из ВК загружает только процесс обновления
+        await message.answer("⚠️ Каталог обновляет процесс обновления кластера, обработчик загрузит новую версию автоматически.")
+        return
         
     await message.answer("🔄 Начинаю обновление кэша...")
     
     try:
         # Обновляем данные о магазинах
-        global shops_categories_cache, shops_categories_cache_time
-        await vk_api_rate_limit()  # Ограничение API
         shops = await get_shop_list_async(config.VK_TOKEN, config.VK_GROUP_ID, force_update=True)
-        shops_categories_cache = shops
-        shops_categories_cache_time = time.time()
+        if not store_shop_catalog(shops):
+            await message.answer("⚠️ Не удалось получить магазины из ВКонтакте, оставлен прежний каталог.")
+            shops = shops_categories_cache
+        await refresh_static_screens()
         
         # Подсчитываем общее количество магазинов
         total_shops = len(shops.get("all_shops", {}))
@@ -1987,44 +2538,11 @@ async def update_cache_command(message: types.Message):
         
         await message.answer(shops_report)
         
-        # Обновляем данные об альбомах
-        await vk_api_rate_limit()  # Ограничение API
-        albums = await get_album_names_async(config.VK_TOKEN, config.VK_GROUP_ID, force_update=True)
-        await message.answer(f"✅ Данные об альбомах обновлены. Альбомов: {len(albums)}")
-        
-        # Обновляем кэш категорий мастеров
-        global non_empty_masters_cache, non_empty_masters_cache_time
-        
-        # Показываем сообщение о начале обновления кэша мастеров
+        # Обновляем базу мастеров полностью: фото, работы, метаданные альбомов и карточки
         updating_masters_message = await message.answer("🔄 Обновляю кэш категорий мастеров...")
-        
-        # Создаем задачи для параллельной загрузки фотографий
-        tasks = []
-        for cat, album_id in albums.items():
-            # Применяем ограничение частоты запросов перед каждым запросом
-            await vk_api_rate_limit()
-            tasks.append((cat, album_id, get_album_photos_async(config.VK_TOKEN, config.VK_GROUP_ID, album_id, force_update=True)))
-        
-        # Обрабатываем результаты
-        category_buttons = []
-        all_categories = {}
-        
-        # Сохраняем все категории и их ID
-        for cat, album_id in albums.items():
-            all_categories[cat] = album_id
-            
-        # Получаем информацию о количестве фото в каждой категории
-        for cat, album_id, task in tasks:
-            photos = await task
-            count = len(photos) if photos else 0
-            category_buttons.append((cat, count))
-        
-        # Сохраняем результаты в кэш
-        non_empty_masters_cache = {
-            "buttons": category_buttons,
-            "all_categories": all_categories
-        }
-        non_empty_masters_cache_time = time.time()
+        await preload_masters_data()
+        category_buttons = non_empty_masters_cache.get("buttons", [])
+        all_categories = non_empty_masters_cache.get("all_categories", {})
         
         # Удаляем сообщение о загрузке и показываем результат
         await updating_masters_message.delete()
@@ -2035,7 +2553,6 @@ async def update_cache_command(message: types.Message):
         await message.answer(f"✅ Кэш категорий мастеров обновлен.\n📊 Всего категорий: {len(all_categories)}\n📈 Категорий с мастерами: {non_empty_count}")
         
         # Обновляем данные о категориях маркета
-        await vk_api_rate_limit()  # Ограничение API
         market_categories = await get_market_categories_async(config.VK_TOKEN, config.VK_GROUP_ID, force_update=True)
         await message.answer(f"✅ Данные о категориях маркета обновлены. Категорий: {len(market_categories)}")
         
@@ -2052,16 +2569,40 @@ async def on_startup(dp):
     logger.info('🚀 Бот запущен')
     
     # Сначала очищаем все обновления, которые могли накопиться
-    await bot.delete_webhook(drop_pending_updates=True)
+    # (в режиме webhook накопившиеся обновления сбрасываются при его регистрации)
+    if config.BOT_ROLE == 'single' and config.BOT_MODE != 'webhook':
+        await bot.delete_webhook(drop_pending_updates=True)
+    
+    # Сообщаем о перекрывающих друг друга обработчиках кнопок
+    router.report_conflicts()
     
     # Запускаем таймер очистки кэша
     asyncio.create_task(periodic_cache_cleanup())
+    file_ids.load()
+    
+    if config.BOT_ROLE == 'worker':
+        # Каталог обновляет отдельный процесс, обработчик только следит за опубликованным снимком
+        asyncio.create_task(watch_published_snapshot())
+        logger.info(f'✅ Обработчик кластера готов к работе (PID: {os.getpid()})')
+        return
+    
+    # Процессы разбора каталога создаются до появления рабочих потоков
+    vk.start_process_pool()
+    
+    # Восстанавливаем кэш из снимка на диске, если он есть
+    restored = restore_cache_snapshot()
     
     # Запускаем таймер периодического обновления кэша
     asyncio.create_task(periodic_cache_update())
     
-    # Предварительная загрузка критически важных данных
-    await preload_critical_data()
+    if restored:
+        # Отдаем данные из снимка, пока первое плановое обновление загружает свежие данные из ВК
+        logger.info('Используем данные из снимка, обновление из ВКонтакте выполняется в фоне')
+        if len(static_screens) < len(STATIC_SCREEN_RENDERERS):
+            asyncio.create_task(refresh_static_screens())
+    else:
+        # Предварительная загрузка критически важных данных
+        await preload_critical_data()
     
     logger.info('✅ Бот готов к работе')
 
@@ -2071,11 +2612,29 @@ async def on_shutdown(dp):
     session = await bot.get_session()
     if session and not session.closed:
         await session.close()
+    # Закрываем соединения с API ВКонтакте
+    await vk_async.close()
+    vk.shutdown_process_pool()
+    # Сохраняем file_id отправленных фотографий
+    try:
+        file_ids.save()
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении кэша file_id: {e}")
     # Освобождаем блокировку
     release_lock()
 
+async def run_refresher():
+    """Процесс обновления кластера: загружает каталог из ВК и публикует его снимок для обработчиков"""
+    logger.info('🔄 Процесс обновления каталога запущен')
+    vk.start_process_pool()
+    file_ids.load()
+    # Webhook регистрируется один раз здесь, а не в каждом обработчике
+    await webhook.register_webhook(dp)
+    restore_cache_snapshot()
+    await periodic_cache_update()
+
 # Обработчик для возврата к категориям мастеров (обработчик callback_query)
-@dp.callback_query_handler(lambda c: c.data == "back_to_master_categories", state=[User.select_master, User.view_master])
+@router.callback("back_to_master_categories", state=[User.select_master, User.view_master])
 async def back_to_master_categories_callback(callback_query: types.CallbackQuery, state: FSMContext):
     # Отвечаем на callback
     await bot.answer_callback_query(callback_query.id, "Возвращаемся к категориям мастеров...")
@@ -2108,12 +2667,12 @@ async def back_to_master_categories_callback(callback_query: types.CallbackQuery
     await User.select_master_category.set()
 
 # Обработчик нажатия кнопки "Далее" в карусели мастеров
-@dp.callback_query_handler(lambda c: c.data == "master_next", state=User.view_masters_carousel)
+@router.callback("master_next", state=User.view_masters_carousel)
 async def master_next_callback(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем данные из состояния
     data = await state.get_data()
     current_index = data.get('current_photo_index', 0)
-    photos = data.get('master_photos', [])
+    photos = await get_master_photos(data.get('current_master_category', 'Мастера'))
     
     # Увеличиваем индекс, если не последняя фотография
     if current_index < len(photos) - 1:
@@ -2131,7 +2690,7 @@ async def master_next_callback(callback_query: types.CallbackQuery, state: FSMCo
     await callback_query.answer()
 
 # Обработчик нажатия кнопки "Назад" в карусели мастеров
-@dp.callback_query_handler(lambda c: c.data == "master_prev", state=User.view_masters_carousel)
+@router.callback("master_prev", state=User.view_masters_carousel)
 async def master_prev_callback(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем данные из состояния
     data = await state.get_data()
@@ -2153,12 +2712,12 @@ async def master_prev_callback(callback_query: types.CallbackQuery, state: FSMCo
     await callback_query.answer()
 
 # Обработчик нажатия на счетчик (ничего не делает)
-@dp.callback_query_handler(lambda c: c.data == "master_count", state=User.view_masters_carousel)
+@router.callback("master_count", state=User.view_masters_carousel)
 async def master_count_callback(callback_query: types.CallbackQuery):
     await callback_query.answer("Текущая позиция в галерее")
 
 # Обработчик нажатия кнопки "Вернуться к категориям" в карусели мастеров
-@dp.callback_query_handler(lambda c: c.data == "master_back_to_categories", state=User.view_masters_carousel)
+@router.callback("master_back_to_categories", state=User.view_masters_carousel)
 async def master_back_to_categories_callback(callback_query: types.CallbackQuery, state: FSMContext):
     # Удаляем предыдущее сообщение
     await callback_query.message.delete()
@@ -2171,47 +2730,20 @@ async def master_back_to_categories_callback(callback_query: types.CallbackQuery
     await callback_query.answer()
 
 # Обработчик для кнопки "Вернуться к анкете мастера" в клавиатуре
-@dp.message_handler(lambda m: m.text == "◀️ Вернуться к анкете мастера", state=User.view_master_works)
+@router.message("◀️ Вернуться к анкете мастера", state=User.view_master_works)
 async def keyboard_back_to_master(message: types.Message, state: FSMContext):
     # Получаем необходимые данные из текущего состояния
     data = await state.get_data()
     category = data.get('current_master_category', 'Мастера')
-    master_info = data.get('master_info', {})
+    master_id = data.get('current_master_id')
     
-    # Логируем информацию о мастере для отладки
-    logger.info(f"Информация о мастере при возврате через клавиатуру: {master_info.get('text', 'Нет информации')}")
-    
-    # Получаем фотографии мастера по категории
-    album_id = None
-    master_photos = []
+    # Получаем фотографии мастеров категории из кэша базы мастеров
+    master_photos = await get_master_photos(category)
     
-    # Сначала проверяем, есть ли фотографии в кэше
-    global non_empty_masters_cache
-    if non_empty_masters_cache and "master_photos" in non_empty_masters_cache and category in non_empty_masters_cache["master_photos"]:
-        master_photos = non_empty_masters_cache["master_photos"][category]
-        logger.info(f"Использую кэшированные фотографии мастеров для категории '{category}'")
-    else:
-        # Если нет, пробуем получить альбом через кэш категорий
-        if non_empty_masters_cache and "all_categories" in non_empty_masters_cache:
-            album_id = non_empty_masters_cache["all_categories"].get(category)
-        
-        if not album_id:
-            # Если не получилось, просто возвращаемся к категориям
-            await back_to_master_categories_handler(message, state)
-            return
-        
-        # Получаем фото мастера
-        await vk_api_rate_limit()
-        master_photos = await get_album_photos_async(config.VK_TOKEN, config.VK_GROUP_ID, album_id)
-        
-        # Сохраняем в кэш
-        if master_photos and len(master_photos) > 0:
-            if not non_empty_masters_cache:
-                non_empty_masters_cache = {}
-            if "master_photos" not in non_empty_masters_cache:
-                non_empty_masters_cache["master_photos"] = {}
-            non_empty_masters_cache["master_photos"][category] = master_photos
-            logger.info(f"Сохранил {len(master_photos)} фотографий мастеров в кэш для категории '{category}'")
+    if not master_photos:
+        # Если не получилось, просто возвращаемся к категориям
+        await back_to_master_categories_handler(message, state)
+        return
     
     # Очищаем все данные состояния
     await state.finish()
@@ -2219,35 +2751,28 @@ async def keyboard_back_to_master(message: types.Message, state: FSMContext):
     # Переходим обратно в состояние просмотра карусели мастеров
     await User.view_masters_carousel.set()
     
-    # Находим индекс мастера по его информации
-    current_photo_index = 0
-    if master_info and master_photos:
-        master_text = master_info.get('text', '')
-        for i, photo in enumerate(master_photos):
-            if photo.get('text') == master_text:
-                current_photo_index = i
-                logger.info(f"Найден индекс мастера: {i}")
-                break
-    
-    # Сохраняем данные для просмотра анкеты мастера, включая информацию о мастере
+    # Находим индекс мастера по его ID
+    current_photo_index = find_master_index(master_photos, master_id)
+    logger.info(f"Найден индекс мастера: {current_photo_index}")
+    
+    # Сохраняем ссылки для просмотра анкеты мастера
     await state.update_data(
         current_master_category=category,
-        master_photos=master_photos,
         current_photo_index=current_photo_index,
-        master_info=master_info
+        current_master_id=master_id
     )
     
     # Отправляем фото мастера
     await send_master_photo(message.chat.id, state)
 
 # Обработчик для кнопки "НАЗАД К КАТЕГОРИЯМ МАСТЕРОВ" в клавиатуре при просмотре работ
-@dp.message_handler(lambda m: m.text == "◀️ НАЗАД К КАТЕГОРИЯМ МАСТЕРОВ ◀️", state=User.view_master_works)
+@router.message("◀️ НАЗАД К КАТЕГОРИЯМ МАСТЕРОВ ◀️", state=User.view_master_works)
 async def keyboard_back_to_categories_from_works(message: types.Message, state: FSMContext):
     # Вызываем функцию возврата к категориям мастеров
     await back_to_master_categories_handler(message, state)
 
 # Обработчик для просмотра списка мастеров
-@dp.message_handler(lambda m: m.text == "👨‍🔧 Каталог мастеров")
+@router.message("👨‍🔧 Каталог мастеров")
 async def masters_handler(message: types.Message, state: FSMContext):
     # Показываем пользователю сообщение о загрузке
     loading_message = await message.answer("🔄 <b>Загружаю категории мастеров...</b>\n\nПожалуйста, подождите.", parse_mode=ParseMode.HTML)
@@ -2283,14 +2808,10 @@ async def masters_handler(message: types.Message, state: FSMContext):
                        parse_mode=ParseMode.HTML,
                        reply_markup=kb)
     
-    # Сохраняем категории мастеров в состоянии пользователя
-    if non_empty_masters_cache and "all_categories" in non_empty_masters_cache:
-        await state.update_data(master_categories=non_empty_masters_cache["all_categories"])
-    
     await User.select_master_category.set()
 
 # Обработчик для просмотра мастеров по категории
-@dp.callback_query_handler(lambda c: c.data and c.data.startswith('master_cat:'), state=User.select_master_category)
+@router.callback(prefix='master_cat:', state=User.select_master_category)
 async def process_master_category(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем название выбранной категории
     category_name = callback_query.data.split(':')[1]
@@ -2319,8 +2840,8 @@ async def process_master_category(callback_query: types.CallbackQuery, state: FS
         )
         return
     
-    # Сохраняем выбранную категорию и мастеров в состоянии
-    await state.update_data(current_category=category_name, masters=master_photos)
+    # Сохраняем в состоянии только выбранную категорию
+    await state.update_data(current_category=category_name)
     
     # Создаем клавиатуру с мастерами
     kb = InlineKeyboardMarkup(row_width=1)
@@ -2349,7 +2870,7 @@ async def process_master_category(callback_query: types.CallbackQuery, state: FS
     await User.select_master.set()
 
 # Обработчик для просмотра информации о мастере
-@dp.callback_query_handler(lambda c: c.data and c.data.startswith('master:'), state=User.select_master)
+@router.callback(prefix='master:', state=User.select_master)
 async def process_master_selection(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем индекс выбранного мастера
     master_index = int(callback_query.data.split(':')[1])
@@ -2360,7 +2881,7 @@ async def process_master_selection(callback_query: types.CallbackQuery, state: F
     # Получаем данные из состояния
     data = await state.get_data()
     category_name = data.get('current_category')
-    masters = data.get('masters', [])
+    masters = await get_master_photos(category_name) if category_name else []
     
     if not masters or master_index >= len(masters):
         await bot.edit_message_text(
@@ -2379,15 +2900,10 @@ async def process_master_selection(callback_query: types.CallbackQuery, state: F
     master_id = master.get('id')
     
     # Получаем работы мастера из кэша
-    global non_empty_masters_cache
-    master_works = []
-    if "master_works" in non_empty_masters_cache and category_name in non_empty_masters_cache["master_works"]:
-        category_works = non_empty_masters_cache["master_works"][category_name]
-        if master_id in category_works:
-            master_works = category_works[master_id]
+    master_works = await get_master_works(category_name, master_id)
     
-    # Сохраняем информацию о мастере и его работах в состоянии
-    await state.update_data(master_info=master, master_works=master_works)
+    # Сохраняем в состоянии ссылку на мастера
+    await state.update_data(current_master_id=master_id)
     
     # Формируем текст сообщения
     message_text = f"👨‍🔧 <b>{master_name}</b>\n\n"
@@ -2457,12 +2973,12 @@ async def process_master_selection(callback_query: types.CallbackQuery, state: F
     await User.view_master.set()
 
 # Обработчик для просмотра всех работ мастера
-@dp.callback_query_handler(lambda c: c.data and c.data.startswith('master_works:'), state=User.view_master)
+@router.callback(prefix='master_works:', state=User.view_master)
 async def process_master_works(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем данные из состояния
     data = await state.get_data()
-    master_works = data.get('master_works', [])
-    master_info = data.get('master_info', {})
+    master_info = await get_current_master(data)
+    master_works = await get_master_works(data.get('current_category'), master_info.get('id'))
     
     # Получаем имя мастера
     master_name = master_info.get('text', 'Мастер')
@@ -2501,12 +3017,12 @@ async def process_master_works(callback_query: types.CallbackQuery, state: FSMCo
     )
 
 # Обработчик для возврата к информации о мастере
-@dp.callback_query_handler(lambda c: c.data == "back_to_master_info", state=User.view_master)
+@router.callback("back_to_master_info", state=User.view_master)
 async def back_to_master_info(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем данные из состояния
     data = await state.get_data()
-    master_info = data.get('master_info', {})
-    master_works = data.get('master_works', [])
+    master_info = await get_current_master(data)
+    master_works = await get_master_works(data.get('current_category'), master_info.get('id'))
     
     # Получаем информацию о мастере
     master_name = master_info.get('text', 'Мастер')
@@ -2581,12 +3097,12 @@ async def back_to_master_info(callback_query: types.CallbackQuery, state: FSMCon
         )
 
 # Обработчик для возврата к списку мастеров в категории
-@dp.callback_query_handler(lambda c: c.data == "back_to_masters", state=User.view_master)
+@router.callback("back_to_masters", state=User.view_master)
 async def back_to_masters_list(callback_query: types.CallbackQuery, state: FSMContext):
     # Получаем данные из состояния
     data = await state.get_data()
     category_name = data.get('current_category')
-    masters = data.get('masters', [])
+    masters = await get_master_photos(category_name) if category_name else []
     
     # Отвечаем на callback
     await bot.answer_callback_query(callback_query.id, "Возвращаемся к списку мастеров...")
@@ -2637,7 +3153,7 @@ def get_back_to_masters_keyboard():
     return kb
 
 # Обработчик для возврата к категориям мастеров (обработчик сообщений)
-@dp.message_handler(lambda m: m.text == "◀️ НАЗАД К КАТЕГОРИЯМ МАСТЕРОВ ◀️", state="*")
+@router.message("◀️ НАЗАД К КАТЕГОРИЯМ МАСТЕРОВ ◀️", state="*")
 async def back_to_master_categories_handler(message: types.Message, state: FSMContext):
     # Пишем в лог для отладки
     logger.info(f"Обработка возврата к категориям мастеров с кнопкой: '{message.text}'")
@@ -2652,8 +3168,10 @@ async def back_to_master_categories_handler(message: types.Message, state: FSMCo
         global non_empty_masters_cache, non_empty_masters_cache_time
         current_time = time.time()
         
-        # Проверяем, есть ли актуальный кэш непустых категорий
-        if non_empty_masters_cache and current_time - non_empty_masters_cache_time < config.CACHE_TIME:
+        # Проверяем, есть ли кэш непустых категорий (устаревший кэш обновляется в фоне плановым обновлением)
+        if non_empty_masters_cache:
+            if current_time - non_empty_masters_cache_time >= config.CACHE_TIME:
+                logger.info("Кэш категорий мастеров устарел, используем его до фонового обновления")
             logger.info("Используем кэш категорий мастеров при возврате")
             category_buttons = non_empty_masters_cache.get("buttons", [])
             all_categories = non_empty_masters_cache.get("all_categories", {})
@@ -2685,9 +3203,9 @@ async def back_to_master_categories_handler(message: types.Message, state: FSMCo
                             parse_mode=ParseMode.HTML,
                             reply_markup=kb)
         
-        # Устанавливаем состояние и сохраняем данные
+        # Устанавливаем состояние (категории берутся из общего кэша)
         await User.get_master.set()
-        await state.set_data(all_categories)
+        await state.reset_data()
         
         logger.info("Успешно выполнен возврат к категориям мастеров")
     
@@ -2698,7 +3216,7 @@ async def back_to_master_categories_handler(message: types.Message, state: FSMCo
         await state.finish()
 
 # Обработчик для кнопки "Посмотреть работы мастера"
-@dp.callback_query_handler(lambda c: c.data.startswith("master_works_"), state=User.view_masters_carousel)
+@router.callback(prefix="master_works_", state=User.view_masters_carousel)
 async def master_works_callback(callback_query: types.CallbackQuery, state: FSMContext):
     # Извлекаем ID фотографии из callback_data
     photo_id = callback_query.data.replace("master_works_", "")
@@ -2711,42 +3229,15 @@ async def master_works_callback(callback_query: types.CallbackQuery, state: FSMC
     data = await state.get_data()
     category = data.get('current_master_category', 'Мастера')
     
-    # Получаем текущую фотографию мастера
-    photos = data.get('master_photos', [])
-    current_index = data.get('current_photo_index', 0)
-    
-    # Проверяем, что у нас есть фотографии мастеров и индекс в пределах списка
-    if photos and 0 <= current_index < len(photos):
-        # Сохраняем информацию о текущем мастере
-        master_info = photos[current_index]
-        logger.info(f"Сохраняем информацию о мастере: {master_info.get('text', 'Неизвестный мастер')}")
+    try:
+        master_id = int(photo_id)
+    except ValueError:
+        master_id = None
     
     try:
-        # Сначала проверяем, есть ли работы мастера в кэше
-        work_photos = []
-        global non_empty_masters_cache
-        if (non_empty_masters_cache and 
-            "master_works" in non_empty_masters_cache and 
-            category in non_empty_masters_cache["master_works"] and 
-            photo_id in non_empty_masters_cache["master_works"][category]):
-            # Берем работы из кэша
-            work_photos = non_empty_masters_cache["master_works"][category][photo_id]
-            logger.info(f"Использую кэшированные работы мастера для фото ID: {photo_id}")
-        else:
-            # Если в кэше нет, получаем комментарии к фотографии (работы мастера)
-            logger.info(f"Загружаем работы мастера для фото ID: {photo_id}")
-            work_photos = await get_photo_comments_async(config.VK_TOKEN, config.VK_GROUP_ID, photo_id)
-            
-            # Сохраняем в кэш для будущего использования
-            if work_photos and len(work_photos) > 0:
-                if not non_empty_masters_cache:
-                    non_empty_masters_cache = {}
-                if "master_works" not in non_empty_masters_cache:
-                    non_empty_masters_cache["master_works"] = {}
-                if category not in non_empty_masters_cache["master_works"]:
-                    non_empty_masters_cache["master_works"][category] = {}
-                non_empty_masters_cache["master_works"][category][photo_id] = work_photos
-                logger.info(f"Сохранил {len(work_photos)} работ мастера в кэш для фото ID: {photo_id}")
+        # Работы берутся из кэша базы мастеров, а при его отсутствии - из ВКонтакте
+        logger.info(f"Загружаем работы мастера для фото ID: {photo_id}")
+        work_photos = await get_master_works(category, master_id)
         
         # Удаляем сообщение о загрузке
         await loading_message.delete()
@@ -2768,28 +3259,23 @@ async def master_works_callback(callback_query: types.CallbackQuery, state: FSMC
         # Полностью очищаем предыдущее состояние
         await state.finish()
         
-        # Получаем информацию о мастере
-        master_info = None
-        if photos and 0 <= current_index < len(photos):
-            master_info = photos[current_index]
-            logger.info(f"Используем информацию о мастере из фотографии: {master_info.get('text', 'Неизвестный мастер')}")
-        else:
-            master_info = data.get('master_info', {})
-            logger.info(f"Используем информацию о мастере из состояния: {master_info.get('text', 'Неизвестный мастер')}")
-        
         # Переходим в состояние просмотра работ мастера
         await User.view_master_works.set()
         
-        # Сохраняем необходимые данные, включая информацию о мастере
+        # Сохраняем ссылки на категорию и мастера, сами работы берутся из кэша
         await state.update_data(
-            master_work_photos=work_photos,
             current_work_index=0,
+            current_work_page=0,
             current_master_category=category,
-            master_info=master_info
+            current_master_id=master_id
         )
         
-        # Отправляем первую фотографию работы
-        await send_master_work_photo(callback_query.message.chat.id, state)
+        if config.MASTER_WORKS_GALLERY:
+            # Работы показываются альбомами, следующая страница - по кнопке "Показать ещё"
+            await send_master_works_page(callback_query.message.chat.id, state)
+        else:
+            # Отправляем первую фотографию работы
+            await send_master_work_photo(callback_query.message.chat.id, state)
     except Exception as e:
         logger.error(f"Ошибка при получении работ мастера: {e}")
         await loading_message.delete()
@@ -2798,7 +3284,7 @@ async def master_works_callback(callback_query: types.CallbackQuery, state: FSMC
             reply_markup=None
         ) 
 # Обработчик для кнопки "Главное меню" в inline-клавиатуре
-@dp.callback_query_handler(lambda c: c.data == "main_menu", state="*")
+@router.callback("main_menu", state="*")
 async def main_menu_callback(callback_query: types.CallbackQuery, state: FSMContext):
     # Отвечаем на callback-запрос
     await callback_query.answer()
@@ -2817,14 +3303,25 @@ async def main_menu_callback(callback_query: types.CallbackQuery, state: FSMCont
 
 if __name__ == '__main__':
     try:
-        # Проверяем, не запущен ли уже бот
-        if is_bot_already_running():
+        # Проверяем, не запущен ли уже бот (обработчиков кластера может быть несколько)
+        if config.BOT_ROLE != 'worker' and is_bot_already_running():
             logger.error('Бот уже запущен! Завершение работы.')
             sys.exit(1)
             
-        # Запускаем бота с пропуском накопившихся обновлений
-        logger.info('Запуск бота...')
-        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
+        if config.BOT_ROLE == 'refresher':
+            asyncio.get_event_loop().run_until_complete(run_refresher())
+        elif config.BOT_ROLE == 'worker':
+            # Обработчики слушают один порт, ядро распределяет соединения между ними
+            logger.info(f'Запуск обработчика кластера (PID: {os.getpid()})...')
+            webhook.start_webhook(dp, on_startup=on_startup, on_shutdown=on_shutdown, register=False, reuse_port=True)
+        elif config.BOT_MODE == 'webhook':
+            # Запускаем бота в режиме webhook на локальном aiohttp-сервере
+            logger.info('Запуск бота в режиме webhook...')
+            webhook.start_webhook(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+        else:
+            # Запускаем бота с пропуском накопившихся обновлений
+            logger.info('Запуск бота...')
+            executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
     except aiogram.utils.exceptions.TerminatedByOtherGetUpdates:
         logger.error('Бот уже запущен! Завершение работы текущего экземпляра.')
     except (KeyboardInterrupt, SystemExit):
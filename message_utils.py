@@ -1,6 +1,7 @@
 import config
 import logging
 from aiogram.utils.markdown import hide_link, link
+from file_id_cache import send_cached_photo
 
 logger = logging.getLogger(__name__)
 
@@ -89,20 +90,20 @@ async def send_photo_with_links(message, photo, caption=None, parse_mode=None, r
         
         # Проверяем длину подписи (Telegram ограничивает длину подписи до 1024 символов)
         if len(caption_with_links) <= 1024:
-            return await message.answer_photo(
-                photo=photo, 
+            return await send_cached_photo(lambda media: message.answer_photo(
+                photo=media, 
                 caption=caption_with_links, 
                 parse_mode=parse_mode, 
                 reply_markup=reply_markup, 
                 **kwargs
-            )
+            ), photo)
         else:
             # Если подпись слишком длинная, отправляем фото без подписи
-            photo_message = await message.answer_photo(
-                photo=photo,
+            photo_message = await send_cached_photo(lambda media: message.answer_photo(
+                photo=media,
                 reply_markup=reply_markup,
                 **kwargs
-            )
+            ), photo)
             
             # А затем отправляем текст отдельным сообщением
             await message.answer(
@@ -113,8 +114,8 @@ async def send_photo_with_links(message, photo, caption=None, parse_mode=None, r
             return photo_message
     else:
         # Если нет подписи, просто отправляем фото
-        return await message.answer_photo(
-            photo=photo,
+        return await send_cached_photo(lambda media: message.answer_photo(
+            photo=media,
             reply_markup=reply_markup,
             **kwargs
-        ) 
\ No newline at end of file
+        ), photo) 
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+Ограничители частоты запросов на основе алгоритма token bucket
+"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket: пополняется со скоростью rate токенов в секунду,
+    вмещает не более capacity токенов. Ожидающие получают токены по очереди.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1):
+        """
+        Ждет свободные токены и возвращает время ожидания в секундах
+
+        Если токенов нужно больше, чем вмещает bucket, ожидается полный bucket,
+        а недостающие токены уходят в долг и задерживают следующие запросы
+        """
+        started = time.monotonic()
+        need = min(tokens, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < need:
+                await asyncio.sleep((need - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+        return time.monotonic() - started
+
+
+class WaitHistogram:
+    """Гистограмма времени ожидания (верхние границы корзин в секундах)"""
+
+    BOUNDS = (0.001, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BOUNDS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(self.BOUNDS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": list(zip(self.BOUNDS, self.counts)),
+        }
+
+
+class VkRateLimiter:
+    """
+    Ограничитель запросов к API ВКонтакте для одного токена.
+
+    Общий bucket соответствует лимиту токена (3 запроса в секунду для
+    пользовательского токена, 20 для токена сообщества), дополнительные
+    bucket'ы задают собственные лимиты отдельных методов.
+    """
+
+    def __init__(self, rps, method_limits=None):
+        self.rps = rps
+        self.bucket = TokenBucket(rps)
+        self.method_buckets = {method: TokenBucket(limit) for method, limit in (method_limits or {}).items()}
+        self.histograms = {}
+
+    async def acquire(self, method):
+        """Ждет разрешения на один запрос к методу и возвращает время ожидания"""
+        waited = 0.0
+        method_bucket = self.method_buckets.get(method)
+        if method_bucket is not None:
+            waited += await method_bucket.acquire()
+        waited += await self.bucket.acquire()
+
+        histogram = self.histograms.get(method)
+        if histogram is None:
+            histogram = self.histograms[method] = WaitHistogram()
+        histogram.observe(waited)
+        return waited
+
+    def stats(self):
+        """Возвращает гистограммы ожидания по методам"""
+        return {method: histogram.snapshot() for method, histogram in self.histograms.items()}
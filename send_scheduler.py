@@ -0,0 +1,155 @@
+"""
+Планировщик исходящих сообщений Telegram
+
+Все запросы бота на отправку и редактирование сообщений проходят через
+общий token bucket (ограничение Telegram около 30 сообщений в секунду)
+и bucket чата (около 1 сообщения в секунду с небольшим запасом на серии).
+При ошибке RetryAfter запрос повторяется после указанной Telegram паузы.
+Ответы пользователю имеют приоритет над массовой отправкой: массовые
+сообщения ждут, пока в очереди есть интерактивные.
+"""
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import time
+from collections import OrderedDict
+from aiogram import Bot
+from aiogram.utils import exceptions
+import config
+from rate_limiter import TokenBucket, WaitHistogram
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Приоритет сообщений, отправляемых в текущей задаче
+send_priority = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+# Методы Bot API, на которые распространяются ограничения частоты сообщений
+LIMITED_METHOD_PREFIXES = ("send", "edit", "copyMessage", "forwardMessage")
+
+
+def message_count(method, data):
+    """Сколько сообщений запрос занимает в общем лимите бота: альбом - по числу фото в нем"""
+    if method == "sendMediaGroup" and data and data.get("media"):
+        media = data["media"]
+        if isinstance(media, str):
+            media = json.loads(media)
+        return max(len(media), 1)
+    return 1
+
+
+@contextlib.contextmanager
+def bulk_sends():
+    """Помечает сообщения, отправляемые внутри блока, как массовые (с низким приоритетом)"""
+    token = send_priority.set(BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class SendScheduler:
+    """Общий и початовый лимиты отправки с приоритетом интерактивных сообщений"""
+
+    def __init__(self, global_rate, chat_rate, chat_burst, max_chats=10000):
+        self.bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self._chat_buckets = OrderedDict()
+        self._interactive_waiting = 0
+        self._interactive_idle = asyncio.Event()
+        self._interactive_idle.set()
+        self._bulk_lock = asyncio.Lock()
+        self.histograms = {INTERACTIVE: WaitHistogram(), BULK: WaitHistogram()}
+        self.retries = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            # Храним bucket'ы только недавно активных чатов
+            while len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id, priority, count=1):
+        """
+        Ждет разрешения на отправку и возвращает время ожидания
+
+        count сообщений списывается только с общего лимита бота: альбом
+        в чате считается одним сообщением, иначе после каждого альбома
+        чат ждал бы, пока вернется долг в несколько секунд.
+        """
+        started = time.monotonic()
+        if chat_id is not None:
+            await self._chat_bucket(chat_id).acquire()
+
+        if priority == BULK:
+            # Массовые сообщения встают в очередь общего лимита по одному и только
+            # когда там нет ответов пользователям, поэтому ответы не ждут всю серию
+            async with self._bulk_lock:
+                while not self._interactive_idle.is_set():
+                    await self._interactive_idle.wait()
+                await self.bucket.acquire(count)
+        else:
+            self._interactive_waiting += 1
+            self._interactive_idle.clear()
+            try:
+                await self.bucket.acquire(count)
+            finally:
+                self._interactive_waiting -= 1
+                if not self._interactive_waiting:
+                    self._interactive_idle.set()
+
+        waited = time.monotonic() - started
+        self.histograms[priority].observe(waited)
+        return waited
+
+    def stats(self):
+        """Возвращает гистограммы ожидания по приоритетам и число повторов после RetryAfter"""
+        return {
+            "waits": {priority: histogram.snapshot() for priority, histogram in self.histograms.items()},
+            "retries": self.retries,
+            "chats": len(self._chat_buckets),
+        }
+
+
+class ScheduledBot(Bot):
+    """Бот, отправляющий сообщения через планировщик с учетом лимитов Telegram"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = SendScheduler(
+            config.TG_GLOBAL_RATE_LIMIT,
+            config.TG_CHAT_RATE_LIMIT,
+            config.TG_CHAT_BURST
+        )
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if not method.startswith(LIMITED_METHOD_PREFIXES):
+            return await super().request(method, data, files, **kwargs)
+
+        chat_id = data.get("chat_id") if data else None
+        priority = send_priority.get()
+        count = message_count(method, data)
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(chat_id, priority, count)
+            try:
+                return await super().request(method, data, files, **kwargs)
+            except exceptions.RetryAfter as e:
+                if attempt >= config.TG_SEND_MAX_RETRIES:
+                    raise
+                attempt += 1
+                self.scheduler.retries += 1
+                logger.warning(f"Telegram ограничил отправку ({method}, чат {chat_id}), повтор через {e.timeout} сек")
+                await asyncio.sleep(e.timeout)
@@ -0,0 +1,80 @@
+"""
+Снимок кэша на диске для быстрого перезапуска бота
+
+Снимок хранится в виде JSON, сжатого gzip, с номером версии формата.
+Запись выполняется атомарно: сначала во временный файл, затем переименование.
+В кластерном режиме этот же файл служит опубликованным каталогом для обработчиков.
+"""
+import gzip
+import json
+import logging
+import mmap
+import os
+import time
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+# Версия формата снимка (увеличивается при несовместимых изменениях структуры кэша)
+SNAPSHOT_VERSION = 1
+
+
+def dump_snapshot(data):
+    """Сериализует данные снимка в байты JSON (выполняется в цикле событий)"""
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "data": data,
+    }
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_snapshot(path, raw):
+    """Сжимает и атомарно записывает сериализованный снимок на диск"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wb", compresslevel=5) as f:
+        f.write(raw)
+    os.replace(tmp_path, path)
+
+
+def snapshot_version(path):
+    """
+    Возвращает версию опубликованного снимка или None, если снимка нет
+
+    Снимок заменяется атомарно, поэтому новый файл отличается индексным дескриптором,
+    временем изменения и размером - их сочетание и служит версией
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def load_snapshot(path):
+    """
+    Загружает снимок с диска
+
+    Returns:
+        Данные снимка или None, если файла нет, он поврежден или имеет другую версию
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        # Файл отображается в память и распаковывается без промежуточной копии сжатых данных
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            payload = json.loads(gzip.decompress(mapped).decode("utf-8"))
+    except Exception as e:
+        logger.error(f"Не удалось прочитать снимок кэша {path}: {e}")
+        return None
+
+    if payload.get("version") != SNAPSHOT_VERSION:
+        logger.warning(f"Снимок кэша {path} имеет версию {payload.get('version')}, ожидается {SNAPSHOT_VERSION}")
+        return None
+
+    return payload.get("data")
@@ -1,6 +1,19 @@
+from functools import lru_cache
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 
 
+# Версия каталогов мастеров и магазинов. Увеличивается после каждого обновления кэша,
+# чтобы готовые клавиатуры строились заново только после изменения данных
+catalog_version = 0
+
+def bump_catalog_version():
+    """Отмечает обновление каталогов и освобождает клавиатуры для старых данных"""
+    global catalog_version
+    catalog_version += 1
+    _build_generator.cache_clear()
+    _build_generator_with_categories_button.cache_clear()
+
+
 # Цвета для кнопок (эмодзи как визуальные индикаторы)
 class ButtonColors:
     PRIMARY = "🔵"
@@ -60,6 +73,29 @@ main.row(
 )
 
 
+# Эмодзи, которые могут быть в начале кнопок
+SORT_EMOJI_LIST = ["📋", "📂", "🔧", "🏢", "📝", "🛒", "🔨", "🏪", "🏗", "🚿", "🔌", "🏡", "🧱", "🚜", "🪑", "🌱", "👷‍♂️"]
+
+@lru_cache(maxsize=4096)
+def button_sort_key(button):
+    """Ключ сортировки кнопки (вычисляется один раз для каждого названия)"""
+    # Если это кортеж (название, количество), берем только название
+    if isinstance(button, tuple):
+        button = button[0]
+        
+    # Удаляем эмодзи в начале для сортировки
+    button_text = button
+    for emoji in SORT_EMOJI_LIST:
+        if button.startswith(emoji):
+            button_text = button.replace(emoji, "", 1).strip()
+            break
+            
+    # Удаляем счетчик [N] в конце, если он есть
+    if ' [' in button_text and button_text.endswith(']'):
+        button_text = button_text.split(' [')[0]
+        
+    return button_text.lower()
+
 # Генератор обычной клавиатуры с кнопками
 def sort_buttons(buttons_list):
     """
@@ -67,31 +103,18 @@ def sort_buttons(buttons_list):
     :param buttons_list: список названий кнопок
     :return: отсортированный список кнопок
     """
-    # Эмодзи, которые могут быть в начале кнопок
-    emoji_list = ["📋", "📂", "🔧", "🏢", "📝", "🛒", "🔨", "🏪", "🏗", "🚿", "🔌", "🏡", "🧱", "🚜", "🪑", "🌱", "👷‍♂️"]
-    
-    def get_sort_key(button):
-        # Если это кортеж (название, количество), берем только название
-        if isinstance(button, tuple):
-            button = button[0]
-            
-        # Удаляем эмодзи в начале для сортировки
-        button_text = button
-        for emoji in emoji_list:
-            if button.startswith(emoji):
-                button_text = button.replace(emoji, "", 1).strip()
-                break
-                
-        # Удаляем счетчик [N] в конце, если он есть
-        if ' [' in button_text and button_text.endswith(']'):
-            button_text = button_text.split(' [')[0]
-            
-        return button_text.lower()
-    
-    # Возвращаем отсортированный список
-    return sorted(buttons_list, key=get_sort_key)
+    return sorted(buttons_list, key=button_sort_key)
 
 def generator(buttons_list, row_width=2, force_single_column=False, preserve_emoji=False, sort_alphabetically=True, hide_counts=False):
+    """
+    Возвращает готовую клавиатуру из кэша (см. _build_generator).
+    Клавиатура строится один раз для версии каталога, набора кнопок и параметров
+    """
+    return _build_generator(catalog_version, tuple(buttons_list), row_width, force_single_column,
+                            preserve_emoji, sort_alphabetically, hide_counts)
+
+@lru_cache(maxsize=256)
+def _build_generator(version, buttons_list, row_width, force_single_column, preserve_emoji, sort_alphabetically, hide_counts):
     """
     Создает красивую клавиатуру с кнопками и кнопкой "Назад" вверху и внизу
     :param buttons_list: список названий кнопок или кортежей (название, количество)
@@ -176,6 +199,15 @@ def generator(buttons_list, row_width=2, force_single_column=False, preserve_emo
 
 # Генератор клавиатуры с кнопкой "Вернуться к категориям магазинов" сверху и снизу
 def generator_with_categories_button(buttons_list, row_width=1, force_single_column=True, preserve_emoji=True, sort_alphabetically=True):
+    """
+    Возвращает готовую клавиатуру списка магазинов из кэша
+    (см. _build_generator_with_categories_button)
+    """
+    return _build_generator_with_categories_button(catalog_version, tuple(buttons_list), row_width,
+                                                   force_single_column, preserve_emoji, sort_alphabetically)
+
+@lru_cache(maxsize=256)
+def _build_generator_with_categories_button(version, buttons_list, row_width, force_single_column, preserve_emoji, sort_alphabetically):
     """
     Создает клавиатуру с кнопками магазинов и кнопкой "Вернуться к категориям магазинов" вверху и внизу
     :param buttons_list: список названий кнопок
@@ -241,12 +273,14 @@ def inline_generator(buttons_list, row_width=1, with_back_button=True):
 
 
 # Создание клавиатуры с одной кнопкой для перехода в главное меню
+@lru_cache(maxsize=None)
 def go_back():
     kb = ReplyKeyboardMarkup(resize_keyboard=True)
     kb.add(KeyboardButton('◀️ Назад в главное меню'))
     return kb
 
 # Создание клавиатуры с кнопками навигации
+@lru_cache(maxsize=None)
 def navigation_keyboard(include_shop_categories=False, include_masters_categories=False, include_shop_list=False):
     """
     Создает клавиатуру с кнопками навигации для разных ситуаций
@@ -0,0 +1,86 @@
+"""
+Индекс названий категорий и магазинов для поиска по тексту кнопки
+
+Текст кнопки может отличаться от ключа каталога эмодзи в начале,
+счетчиком [N] в конце, регистром и пробелами. Индекс приводит все варианты
+к одной нормализованной форме и находит ключ каталога за O(1).
+"""
+import re
+import unicodedata
+
+# Суффиксы, которые могут присутствовать в тексте кнопки, но не в названии категории
+LABEL_SUFFIXES = (" мастера", " и спецтехника", " услуги")
+
+# Счетчик количества в конце кнопки, например " [12]"
+COUNTER_RE = re.compile(r"\s*\[\d+\]$")
+SPACES_RE = re.compile(r"\s+")
+
+
+def _is_decoration(char):
+    # Эмодзи и символы (So, Sk), модификаторы (Mn, Cf: вариационные селекторы, ZWJ) и пробелы
+    return char.isspace() or unicodedata.category(char) in ("So", "Sk", "Mn", "Cf")
+
+
+def normalize_label(text):
+    """Приводит текст кнопки или ключ каталога к нормализованной форме"""
+    text = text or ""
+    start = 0
+    while start < len(text) and _is_decoration(text[start]):
+        start += 1
+    text = COUNTER_RE.sub("", text[start:])
+    return SPACES_RE.sub(" ", text).strip().casefold().replace("ё", "е")
+
+
+def _without_suffix(label):
+    for suffix in LABEL_SUFFIXES:
+        if label.endswith(suffix):
+            return label[:-len(suffix)]
+    return None
+
+
+class NameIndex:
+    """Отображение нормализованных названий на ключи каталога"""
+
+    def __init__(self, keys):
+        self._index = {}
+        for key in keys:
+            label = normalize_label(key)
+            # При совпадении нормализованных названий приоритет у первого ключа
+            self._index.setdefault(label, key)
+
+    def __len__(self):
+        return len(self._index)
+
+    def find(self, text):
+        """Возвращает ключ каталога для текста кнопки или None"""
+        label = normalize_label(text)
+        key = self._index.get(label)
+        if key is None:
+            stripped = _without_suffix(label)
+            if stripped:
+                key = self._index.get(stripped)
+        return key
+
+
+class NameIndexCache:
+    """
+    Индексы для нескольких каталогов. Индекс перестраивается, только когда
+    в слот передан другой объект каталога, то есть один раз после обновления кэша
+    """
+
+    def __init__(self):
+        self._slots = {}
+
+    def get(self, slot, catalog):
+        entry = self._slots.get(slot)
+        if entry is None or entry[0] is not catalog:
+            entry = (catalog, NameIndex(catalog.keys()))
+            self._slots[slot] = entry
+        return entry[1]
+
+    def find(self, slot, catalog, text):
+        """Находит ключ каталога по тексту кнопки"""
+        return self.get(slot, catalog).find(text)
+
+    def clear(self):
+        self._slots.clear()
@@ -0,0 +1,238 @@
+"""
+Маршрутизатор текстов кнопок и callback data
+
+Вместо цепочки фильтров-лямбд, которые aiogram проверяет по очереди для
+каждого обновления, маршрутизатор регистрирует в диспетчере по одному
+обработчику сообщений и callback-запросов. Текст кнопки ищется в словаре,
+callback data - в словаре точных значений и в префиксном дереве, поэтому
+время выбора обработчика не зависит от их количества.
+
+Состояния FSM учитываются так же, как в aiogram: маршрут без state работает
+только в состоянии по умолчанию, state="*" - в любом состоянии. Если подходят
+несколько маршрутов, выбирается зарегистрированный первым. Если подходящего
+маршрута нет, обновление передается следующим обработчикам диспетчера.
+"""
+import inspect
+import logging
+from aiogram import types
+from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.dispatcher.handler import SkipHandler
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+ANY_STATE = "*"
+
+
+def resolve_states(state):
+    """Приводит параметр state обработчика к кортежу имен состояний (None - состояние по умолчанию)"""
+    if isinstance(state, (list, tuple, set, frozenset)):
+        return tuple(name for item in state for name in resolve_states(item))
+    if isinstance(state, State):
+        return (state.state,)
+    if inspect.isclass(state) and issubclass(state, StatesGroup):
+        return tuple(state.all_states_names)
+    return (state,)
+
+
+class Route:
+    """Обработчик, зарегистрированный для ключа и состояния"""
+
+    __slots__ = ("handler", "key", "state", "order", "pass_state")
+
+    def __init__(self, handler, key, state, order):
+        self.handler = handler
+        self.key = key
+        self.state = state
+        self.order = order
+        self.pass_state = "state" in inspect.signature(handler).parameters
+
+    def describe(self):
+        key = "любой текст" if self.key is None else repr(self.key)
+        return f"{self.handler.__name__} ({key}, состояние {self.state})"
+
+    async def __call__(self, event, state):
+        if self.pass_state:
+            return await self.handler(event, state=state)
+        return await self.handler(event)
+
+
+class PrefixTrie:
+    """Префиксное дерево: для строки находит маршруты всех ее префиксов за O(длины строки)"""
+
+    def __init__(self):
+        self._root = {}
+        self._buckets = {}
+
+    def bucket(self, prefix):
+        """Возвращает словарь маршрутов {состояние: маршрут} для префикса, создавая его при необходимости"""
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if None not in node:
+            node[None] = self._buckets[prefix] = {}
+        return node[None]
+
+    def matches(self, data):
+        """Словари маршрутов всех префиксов строки (от короткого к длинному)"""
+        node = self._root
+        found = []
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+        return found
+
+    def items(self):
+        return self._buckets.items()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def _select(current, buckets):
+    # Из маршрутов текущего состояния и любого состояния выбирается зарегистрированный первым
+    best = None
+    for bucket in buckets:
+        for route in (bucket.get(current), bucket.get(ANY_STATE)):
+            if route is not None and (best is None or route.order < best.order):
+                best = route
+    return best
+
+
+class Router:
+    """Таблицы маршрутов для текстов кнопок и callback data"""
+
+    def __init__(self):
+        self._order = 0
+        self._texts = {}
+        self._fallbacks = {}
+        self._callbacks = {}
+        self._prefixes = PrefixTrie()
+        self._duplicates = []
+        self._names = {}
+
+    def _add(self, bucket, handler, key, state):
+        self._order += 1
+        self._names.setdefault(handler.__name__, set()).add(handler)
+        for name in resolve_states(state):
+            route = Route(handler, key, name, self._order)
+            if name in bucket:
+                # Повторная регистрация для того же ключа и состояния никогда не сработает
+                self._duplicates.append((bucket[name], route))
+            else:
+                bucket[name] = route
+
+    def message(self, *texts, state=None):
+        """
+        Регистрирует обработчик сообщений
+
+        Args:
+            *texts: тексты кнопок; без текстов обработчик получает любой текст в указанном состоянии
+            state: состояние FSM, список состояний или "*" (как в aiogram)
+        """
+        def decorator(handler):
+            if texts:
+                for text in texts:
+                    self._add(self._texts.setdefault(text, {}), handler, text, state)
+            else:
+                self._add(self._fallbacks, handler, None, state)
+            return handler
+        return decorator
+
+    def callback(self, *values, prefix=None, state=None):
+        """
+        Регистрирует обработчик callback-запросов
+
+        Args:
+            *values: точные значения callback data
+            prefix: начало callback data (например, "master_cat:")
+            state: состояние FSM, список состояний или "*" (как в aiogram)
+        """
+        def decorator(handler):
+            for value in values:
+                self._add(self._callbacks.setdefault(value, {}), handler, value, state)
+            if prefix is not None:
+                self._add(self._prefixes.bucket(prefix), handler, prefix + "*", state)
+            return handler
+        return decorator
+
+    async def _dispatch_message(self, message: types.Message, state):
+        current = await state.get_state()
+        buckets = [self._fallbacks]
+        if message.text in self._texts:
+            buckets.append(self._texts[message.text])
+        route = _select(current, buckets)
+        if route is None:
+            raise SkipHandler()
+        return await route(message, state)
+
+    async def _dispatch_callback(self, callback_query: types.CallbackQuery, state):
+        data = callback_query.data
+        if data is None:
+            raise SkipHandler()
+        current = await state.get_state()
+        buckets = self._prefixes.matches(data)
+        if data in self._callbacks:
+            buckets.append(self._callbacks[data])
+        route = _select(current, buckets)
+        if route is None:
+            raise SkipHandler()
+        return await route(callback_query, state)
+
+    def setup(self, dispatcher):
+        """Регистрирует маршрутизатор в диспетчере (до остальных обработчиков)"""
+        dispatcher.register_message_handler(self._dispatch_message, state=ANY_STATE)
+        dispatcher.register_callback_query_handler(self._dispatch_callback, state=ANY_STATE)
+
+    def conflicts(self):
+        """Возвращает описания маршрутов, которые перекрыты другими и не сработают полностью или частично"""
+        problems = [
+            f"{duplicate.describe()} не сработает: раньше зарегистрирован {first.describe()}"
+            for first, duplicate in self._duplicates
+        ]
+
+        # Маршрут состояния после маршрута того же ключа для любого состояния
+        buckets = list(self._texts.values()) + list(self._callbacks.values()) + [b for _, b in self._prefixes.items()]
+        for bucket in buckets:
+            any_route = bucket.get(ANY_STATE)
+            for name, route in bucket.items():
+                if any_route is not None and name != ANY_STATE and route.order > any_route.order:
+                    problems.append(f"{route.describe()} не сработает: раньше зарегистрирован {any_route.describe()}")
+
+        # Тексты кнопок, которые в каком-то состоянии перехватывает обработчик любого текста
+        for bucket in self._texts.values():
+            for name, route in bucket.items():
+                for fallback in self._fallbacks.values():
+                    overlaps = name == fallback.state or ANY_STATE in (name, fallback.state)
+                    if overlaps and fallback.order < route.order:
+                        problems.append(f"{route.describe()} в состоянии {fallback.state} не сработает: раньше зарегистрирован {fallback.describe()}")
+
+        # Callback data, которые перехватывает более короткий префикс
+        callbacks = list(self._callbacks.items()) + [(prefix, b) for prefix, b in self._prefixes.items()]
+        for data, bucket in callbacks:
+            for shorter in self._prefixes.matches(data):
+                if shorter is bucket:
+                    continue
+                for name, route in bucket.items():
+                    earlier = _select(name, [shorter])
+                    if earlier is not None and earlier.order < route.order:
+                        problems.append(f"{route.describe()} не сработает: раньше зарегистрирован {earlier.describe()}")
+
+        for name, handlers in self._names.items():
+            if len(handlers) > 1:
+                problems.append(f"несколько разных обработчиков с именем {name}: {len(handlers)}")
+        return problems
+
+    def report_conflicts(self):
+        """Записывает в лог сводку маршрутов и найденные конфликты"""
+        logger.info(
+            f"Маршрутизатор: {len(self._texts)} текстов кнопок, {len(self._callbacks)} значений "
+            f"и {len(self._prefixes)} префиксов callback data, {len(self._fallbacks)} состояний с вводом текста"
+        )
+        problems = self.conflicts()
+        for problem in problems:
+            logger.warning(f"Конфликт маршрутов: {problem}")
+        return problems
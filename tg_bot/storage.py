@@ -0,0 +1,169 @@
+"""
+Хранилище состояний FSM в SQLite
+
+Состояния и данные пользователей сохраняются в локальной базе SQLite,
+поэтому переживают перезапуск бота. Прочитанные записи держатся в памяти,
+запись в базу выполняется сразу при изменении. Если базу используют несколько
+процессов, кэш записей отключается и каждое чтение идет в базу.
+
+Запросы к базе выполняются в отдельном потоке, чтобы обращения к диску
+не останавливали цикл событий. Поток один, поэтому запросы выполняются
+в порядке вызова и чтение после записи видит записанные данные.
+"""
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from aiogram.dispatcher.storage import BaseStorage
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний FSM в файле SQLite"""
+
+    def __init__(self, path, cache_records=True):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        # Ожидание блокировки нужно, когда в базу одновременно пишут несколько процессов
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "chat TEXT NOT NULL, user TEXT NOT NULL, "
+            "state TEXT, data TEXT NOT NULL, bucket TEXT NOT NULL, "
+            "PRIMARY KEY (chat, user))"
+        )
+        self._db.commit()
+        self._records = {}
+        self.cache_records = cache_records
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+
+    def _run(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
+
+    async def close(self):
+        self._records.clear()
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=True)
+
+    async def wait_closed(self):
+        pass
+
+    def _load(self, key):
+        row = self._db.execute("SELECT state, data, bucket FROM fsm WHERE chat = ? AND user = ?", key).fetchone()
+        if row:
+            return {"state": row[0], "data": json.loads(row[1]), "bucket": json.loads(row[2])}
+        return {"state": None, "data": {}, "bucket": {}}
+
+    async def _get_record(self, chat, user):
+        chat, user = map(str, self.check_address(chat=chat, user=user))
+        key = (chat, user)
+        record = self._records.get(key)
+        if record is None:
+            record = await self._run(self._load, key)
+            if self.cache_records:
+                # Пока запись читалась, ее мог загрузить параллельный запрос
+                record = self._records.setdefault(key, record)
+        return key, record
+
+    def _write(self, key, row):
+        if row is None:
+            self._db.execute("DELETE FROM fsm WHERE chat = ? AND user = ?", key)
+        else:
+            self._db.execute("INSERT OR REPLACE INTO fsm (chat, user, state, data, bucket) VALUES (?, ?, ?, ?, ?)", row)
+        self._db.commit()
+
+    async def _save(self, key, record):
+        # Строка для записи готовится сразу, чтобы последующие изменения записи в нее не попали
+        if record["state"] is None and not record["data"] and not record["bucket"]:
+            self._records.pop(key, None)
+            row = None
+        else:
+            row = (*key, record["state"],
+                   json.dumps(record["data"], ensure_ascii=False),
+                   json.dumps(record["bucket"], ensure_ascii=False))
+        await self._run(self._write, key, row)
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        _, record = await self._get_record(chat, user)
+        return record["state"] or self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._get_record(chat, user)
+        return copy.deepcopy(record["data"])
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.Optional[typing.AnyStr] = None):
+        key, record = await self._get_record(chat, user)
+        record["state"] = self.resolve_state(state)
+        await self._save(key, record)
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        key, record = await self._get_record(chat, user)
+        record["data"] = copy.deepcopy(data or {})
+        await self._save(key, record)
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        key, record = await self._get_record(chat, user)
+        record["data"].update(copy.deepcopy(data or {}), **copy.deepcopy(kwargs))
+        await self._save(key, record)
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        key, record = await self._get_record(chat, user)
+        record["state"] = None
+        if with_data:
+            record["data"] = {}
+        await self._save(key, record)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._get_record(chat, user)
+        return copy.deepcopy(record["bucket"])
+
+    async def set_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        key, record = await self._get_record(chat, user)
+        record["bucket"] = copy.deepcopy(bucket or {})
+        await self._save(key, record)
+
+    async def update_bucket(self, *,
+                            chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        key, record = await self._get_record(chat, user)
+        record["bucket"].update(copy.deepcopy(bucket or {}), **copy.deepcopy(kwargs))
+        await self._save(key, record)
@@ -0,0 +1,461 @@
+"""
+Асинхронный клиент API ВКонтакте на aiohttp
+
+Все запросы идут через одну общую aiohttp-сессию с keep-alive соединениями,
+поэтому загрузка данных из ВК не занимает потоки исполнителя.
+Разбор ответов выполняется теми же функциями, что и в синхронном модуле vk.
+"""
+import asyncio
+import contextlib
+import logging
+from collections import OrderedDict
+import aiohttp
+import config
+import vk
+from rate_limiter import VkRateLimiter
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+API_URL = "https://api.vk.com/method/"
+
+# Коды ошибок ВК, при которых запрос имеет смысл повторить с задержкой
+TOO_MANY_REQUESTS_CODE = 6  # Слишком много запросов в секунду
+FLOOD_CONTROL_CODE = 9  # Слишком много однотипных действий
+INTERNAL_ERROR_CODE = 10  # Внутренняя ошибка сервера ВК
+RETRY_ERROR_CODES = (TOO_MANY_REQUESTS_CODE, FLOOD_CONTROL_CODE, INTERNAL_ERROR_CODE)
+
+# Общая HTTP-сессия и клиенты по токенам
+_http_session = None
+_clients = {}
+
+# Кэш страниц фотографий альбомов: (альбом, смещение, время изменения, число фото) -> список фото
+_photo_pages = OrderedDict()
+
+
+class VkApiError(Exception):
+    """Ошибка, которую вернуло API ВКонтакте"""
+
+    def __init__(self, method, code, message):
+        super().__init__(f"[{code}] {message} (метод {method})")
+        self.method = method
+        self.code = code
+        self.message = message
+
+
+def _get_http_session():
+    """Возвращает общую aiohttp-сессию, создавая ее при первом обращении"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=config.VK_HTTP_CONNECTION_LIMIT,
+            limit_per_host=config.VK_HTTP_CONNECTION_LIMIT_PER_HOST
+        )
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=config.VK_HTTP_TIMEOUT)
+        )
+    return _http_session
+
+
+def _prepare_value(value):
+    """Приводит значение параметра к виду, который принимает API ВКонтакте"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return ",".join(str(item) for item in value)
+    return value
+
+
+class AsyncVkClient:
+    """Асинхронный клиент API ВКонтакте для одного токена"""
+
+    def __init__(self, token, token_type=None, api_version=None, max_retries=None):
+        self.token = token
+        self.api_version = api_version or config.VK_API_VERSION
+        self.max_retries = config.API_MAX_RETRIES if max_retries is None else max_retries
+        
+        # Лимит зависит от типа токена: 3 запроса в секунду для пользователя, 20 для сообщества
+        token_type = token_type or config.VK_TOKEN_TYPE
+        rps = config.VK_GROUP_TOKEN_RPS if token_type == "group" else config.VK_USER_TOKEN_RPS
+        self.limiter = VkRateLimiter(rps, config.VK_METHOD_RATE_LIMITS)
+
+    def _retry_delay(self, attempt):
+        """Экспоненциальная задержка перед повторной попыткой"""
+        return config.VK_RETRY_BACKOFF * (2 ** attempt)
+
+    async def call(self, method, **params):
+        """
+        Вызывает метод API ВКонтакте
+
+        Args:
+            method: название метода, например "photos.get"
+            **params: параметры метода
+
+        Returns:
+            Содержимое поля response из ответа ВК
+        """
+        if config.BOT_ROLE == "worker":
+            # Обработчики кластера читают только снимок каталога, к ВК обращается процесс обновления
+            raise VkApiError(method, None, "обработчик кластера не обращается к API ВКонтакте")
+
+        values = {key: _prepare_value(value) for key, value in params.items() if value is not None}
+        values["access_token"] = self.token
+        values["v"] = self.api_version
+
+        attempt = 0
+        while True:
+            # Лимит применяется ровно один раз на каждый исходящий запрос
+            await self.limiter.acquire(method)
+            try:
+                async with _get_http_session().post(API_URL + method, data=values) as response:
+                    payload = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"Сетевая ошибка при вызове {method}: {e}. Повтор через {delay:.1f} сек")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            if "error" in payload:
+                error = payload["error"]
+                code = error.get("error_code")
+                if code in RETRY_ERROR_CODES and attempt < self.max_retries:
+                    delay = self._retry_delay(attempt)
+                    logger.warning(f"Ошибка ВК {code} при вызове {method}. Повтор через {delay:.1f} сек")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                raise VkApiError(method, code, error.get("error_msg", ""))
+
+            return payload.get("response")
+
+    async def photos_get(self, owner_id, album_id, **params):
+        return await self.call("photos.get", owner_id=owner_id, album_id=album_id, **params)
+
+    async def photos_get_albums(self, owner_id, **params):
+        return await self.call("photos.getAlbums", owner_id=owner_id, **params)
+
+    async def photos_get_comments(self, owner_id, photo_id, **params):
+        return await self.call("photos.getComments", owner_id=owner_id, photo_id=photo_id, **params)
+
+    async def market_get(self, owner_id, **params):
+        return await self.call("market.get", owner_id=owner_id, **params)
+
+    async def market_get_all(self, owner_id, album_id, **params):
+        """
+        Получает все товары альбома маркета
+
+        Первая страница дает общее количество товаров, остальные страницы
+        запрашиваются параллельно (в пределах общего лимита запросов)
+
+        Returns:
+            Ответ в формате market.get: {"count": ..., "items": [...]}
+        """
+        page_size = config.MARKET_PAGE_SIZE
+        first_page = await self.market_get(owner_id, album_id=album_id, count=page_size, offset=0, **params)
+        total = first_page.get("count", 0)
+        pages = await asyncio.gather(*[
+            self.market_get(owner_id, album_id=album_id, count=page_size, offset=offset, **params)
+            for offset in range(page_size, total, page_size)
+        ])
+
+        items = list(first_page.get("items", []))
+        for page in pages:
+            items.extend(page.get("items", []))
+        return {"count": total, "items": items}
+
+    async def market_get_albums(self, owner_id, **params):
+        return await self.call("market.getAlbums", owner_id=owner_id, **params)
+
+    async def board_get_topics(self, group_id, **params):
+        return await self.call("board.getTopics", group_id=group_id, **params)
+
+    async def groups_get_by_id(self, group_id, **params):
+        return await self.call("groups.getById", group_id=group_id, **params)
+
+    async def execute(self, code):
+        return await self.call("execute", code=code)
+
+
+def get_client(token):
+    """Возвращает клиент для токена (все клиенты используют общую HTTP-сессию)"""
+    client = _clients.get(token)
+    if client is None:
+        client = _clients[token] = AsyncVkClient(token)
+    return client
+
+
+def get_limiter_stats():
+    """Возвращает статистику ожидания лимитера по всем токенам и методам"""
+    stats = {}
+    for client in _clients.values():
+        for method, snapshot in client.limiter.stats().items():
+            stats[method] = snapshot
+    return stats
+
+
+async def close():
+    """Закрывает общую HTTP-сессию"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+# Асинхронные версии функций модуля vk
+
+async def get_group_description(token, group_id):
+    """Получает описание группы ВКонтакте"""
+    try:
+        group_info = await get_client(token).groups_get_by_id(group_id, fields=["description"])
+
+        if not group_info or not isinstance(group_info, list) or len(group_info) == 0:
+            logger.error(f"Не удалось получить информацию о группе {group_id}")
+            return None
+
+        logger.info(f"Получено описание группы {group_id}, длина: {len(group_info[0].get('description', ''))} символов")
+        return vk.format_group_description(group_info)
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении описания группы {group_id}: {e}")
+        return None
+
+
+async def get_album_names(token, group_id):
+    """Получает названия альбомов группы ВКонтакте"""
+    try:
+        response = await get_client(token).photos_get_albums(-group_id)
+        data = vk.parse_album_names(response)
+        logger.info(f"Получено {len(data)} альбомов из группы {group_id}")
+        return data
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении альбомов: {e}")
+        return {}
+
+
+async def get_albums_meta(token, group_id):
+    """Получает метаданные альбомов группы (ID, время изменения, число фото)"""
+    try:
+        response = await get_client(token).photos_get_albums(-group_id)
+        data = vk.parse_album_meta(response)
+        logger.info(f"Получены метаданные {len(data)} альбомов из группы {group_id}")
+        return data
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении метаданных альбомов: {e}")
+        return {}
+
+
+@contextlib.asynccontextmanager
+async def _no_slot():
+    yield
+
+
+def _store_photo_page(key, page):
+    """Сохраняет страницу фото, удаляя страницы прежних версий того же альбома и самые старые страницы"""
+    album_id, version = key[0], key[2:]
+    for old_key in [k for k in _photo_pages if k[0] == album_id and k[2:] != version]:
+        del _photo_pages[old_key]
+    _photo_pages[key] = page
+    _photo_pages.move_to_end(key)
+    while len(_photo_pages) > config.PHOTO_PAGES_CACHE_SIZE:
+        _photo_pages.popitem(last=False)
+
+
+async def iter_album_photos(token, owner_id, album_id, meta=None, request_slot=None, refresh=False):
+    """
+    Постранично получает фотографии альбома (по PHOTOS_PAGE_SIZE за запрос)
+
+    Если известны метаданные альбома (время изменения и число фото), страницы
+    кэшируются по ключу (альбом, смещение, время изменения, число фото) и при
+    повторной загрузке той же версии альбома отдаются без запросов к ВК.
+    Время изменения альбома не меняется при новых комментариях и правке
+    описаний фото, поэтому полное обновление передает refresh=True и всегда
+    запрашивает страницы заново.
+
+    Args:
+        token: токен ВК
+        owner_id: ID группы ВКонтакте (без минуса)
+        album_id: ID альбома
+        meta: метаданные альбома из get_albums_meta или None
+        request_slot: функция, возвращающая асинхронный контекст для каждого запроса к ВК
+        refresh: не брать страницы из кэша (новые страницы все равно сохраняются)
+
+    Yields:
+        Списки фотографий в формате parse_album_photos
+    """
+    client = get_client(token)
+    page_size = config.PHOTOS_PAGE_SIZE
+    version = (meta.get("updated"), meta.get("size")) if meta else None
+    total = meta.get("size") if meta else None
+    offset = 0
+
+    while total is None or offset < total:
+        key = (album_id, offset) + version if version else None
+        page = _photo_pages.get(key) if key and not refresh else None
+        if page is None:
+            async with (request_slot or _no_slot)():
+                response = await client.photos_get(-owner_id, album_id, extended=1, count=page_size, offset=offset)
+            page = vk.parse_album_photos(response)
+            total = response.get("count", 0)
+            if key:
+                _store_photo_page(key, page)
+
+        yield page
+        if not page:
+            break
+        offset += page_size
+
+
+async def get_album_photos(token, owner_id, album_id):
+    """Получает все фотографии из альбома группы ВКонтакте"""
+    try:
+        result = []
+        async for page in iter_album_photos(token, owner_id, album_id):
+            result.extend(page)
+        logger.info(f"Получено {len(result)} фотографий из альбома {album_id}")
+        return result
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении фотографий из альбома {album_id}: {e}")
+        return []
+
+
+async def get_market_items(token, owner_id):
+    """Получает категории товаров из маркета группы ВКонтакте"""
+    try:
+        albums = await get_client(token).market_get_albums(-owner_id, count=100)
+        result = vk.parse_market_categories(albums)
+        logger.info(f"Получено {len(result)} категорий товаров из группы {owner_id}")
+        return result
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении категорий товаров: {e}")
+        return {}
+
+
+async def parse_shop_albums(albums, album_items, owner_id):
+    """
+    Разбирает альбомы маркета в каталог магазинов
+
+    Каждый альбом разбирается отдельной задачей в пуле процессов, чтобы разбор
+    описаний сотен магазинов не занимал цикл событий и потоки исполнителя.
+    Если пул не запущен, каталог разбирается в потоке исполнителя.
+    """
+    pool = vk.get_process_pool()
+    if pool is None:
+        return await vk.run_in_executor(vk.parse_shop_list, {"items": albums}, album_items, owner_id)
+
+    loop = asyncio.get_event_loop()
+    parsed_albums = await asyncio.gather(*[
+        loop.run_in_executor(pool, vk.parse_market_album, album, items, owner_id)
+        for album, items in zip(albums, album_items)
+    ])
+    return vk.merge_shop_albums(parsed_albums)
+
+
+async def get_shop_list(token, owner_id):
+    """Получает список магазинов-партнеров из группы ВКонтакте"""
+    client = get_client(token)
+    try:
+        # Сначала получаем категории маркета (альбомы)
+        market_albums = await client.market_get_albums(-owner_id, count=100)
+        logger.info(f"Получено {len(market_albums.get('items', []))} категорий маркета из группы {owner_id}")
+
+        # Получаем товары (магазины) всех категорий параллельно, gather сохраняет порядок альбомов
+        albums = market_albums.get("items", [])
+        album_items = await asyncio.gather(*[
+            client.market_get_all(-owner_id, album.get("id"), extended=1)
+            for album in albums
+        ])
+
+        return await parse_shop_albums(albums, album_items, owner_id)
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении списка магазинов: {e}")
+        return {}
+
+
+async def get_market_item_info(token, owner_id, album_id):
+    """Получает товары из выбранной категории"""
+    try:
+        items = await get_client(token).market_get_all(-owner_id, album_id, extended=1)
+        result = [vk.parse_market_item(item, owner_id) for item in items.get("items", [])]
+        logger.info(f"Получено {len(result)} товаров из категории {album_id}")
+        return result
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении товаров из категории {album_id}: {e}")
+        return []
+
+
+async def get_photo_comments(token, owner_id, photo_id):
+    """Получает комментарии к фотографии от сообщества ВКонтакте (None, если запрос не удался)"""
+    try:
+        comments = await get_client(token).photos_get_comments(
+            -owner_id,
+            photo_id,
+            need_likes=0,
+            count=100,  # Максимальное количество комментариев
+            extended=1,  # Расширенная информация
+            fields="attachments"  # Запрашиваем вложения
+        )
+        return vk.parse_photo_comments(comments, owner_id)
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении комментариев к фотографии {photo_id}: {e}")
+        return None
+
+
+async def get_photos_comments_batch(token, owner_id, photo_ids):
+    """
+    Получает комментарии сообщества к нескольким фотографиям пакетами
+    через метод execute (код запроса строит vk.build_photo_comments_code)
+    """
+    result = {}
+    client = get_client(token)
+
+    batch_size = config.VK_EXECUTE_BATCH_SIZE
+    for i in range(0, len(photo_ids), batch_size):
+        batch = photo_ids[i:i + batch_size]
+        try:
+            response = await client.execute(vk.build_photo_comments_code(owner_id, batch))
+        except Exception as e:
+            logger.error(f"Ошибка при пакетном получении комментариев к фотографиям {batch}: {e}")
+            continue
+
+        # Неудачные вызовы внутри execute возвращаются как false
+        for photo_id, comments in zip(batch, response or []):
+            if isinstance(comments, dict):
+                result[photo_id] = vk.parse_photo_comments(comments, owner_id)
+
+    logger.info(f"Пакетно получены комментарии к {len(result)} из {len(photo_ids)} фотографий")
+    return result
+
+
+async def get_topic_info(token, group_id, topic_id):
+    """Получает информацию о теме обсуждения ВКонтакте"""
+    try:
+        topic = await get_client(token).board_get_topics(
+            group_id,
+            topic_ids=[topic_id],
+            extended=1,  # Расширенная информация
+            preview=1,   # Получаем текст первого сообщения
+            preview_length=0  # Полный текст
+        )
+
+        if not topic or "items" not in topic or not topic["items"]:
+            logger.warning(f"Тема {topic_id} не найдена в группе {group_id}")
+            return None
+
+        result = vk.parse_topic_info(topic)
+        logger.info(f"Получена информация о теме {topic_id} группы {group_id}")
+        return result
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении информации о теме {topic_id}: {e}")
+        return None
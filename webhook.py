@@ -0,0 +1,119 @@
+"""
+Запуск бота в режиме webhook
+
+Telegram отправляет обновления POST-запросами на локальный aiohttp-сервер.
+Запросы проверяются по секретному заголовку X-Telegram-Bot-Api-Secret-Token.
+При WEBHOOK_QUEUE_SIZE > 0 обновления складываются в ограниченную очередь
+и обрабатываются фоновыми обработчиками, а Telegram сразу получает ответ.
+"""
+import asyncio
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+from aiogram.utils.executor import Executor
+import config
+
+# Настройка логгера
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Очередь обновлений (None, если обновления обрабатываются прямо в запросе)
+update_queue = None
+_workers = []
+
+
+class SecretWebhookRequestHandler(WebhookRequestHandler):
+    """Обработчик webhook с проверкой секрета и необязательной очередью обновлений"""
+
+    async def post(self):
+        if config.WEBHOOK_SECRET and self.request.headers.get(SECRET_HEADER) != config.WEBHOOK_SECRET:
+            logger.warning(f"Отклонен запрос webhook с неверным секретом от {self.request.remote}")
+            raise web.HTTPUnauthorized()
+
+        if update_queue is None:
+            return await super().post()
+
+        self.validate_ip()
+        dispatcher = self.get_dispatcher()
+        update = await self.parse_update(dispatcher.bot)
+        try:
+            update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку обновления позже
+            logger.warning(f"Очередь обновлений переполнена, обновление {update.update_id} отклонено")
+            return web.Response(status=429, headers={"Retry-After": "1"}, text="queue is full")
+        return web.Response(text="ok")
+
+
+async def _queue_worker(dispatcher):
+    # Контекст бота и диспетчера нужен обработчикам (message.answer и т.п.)
+    Bot.set_current(dispatcher.bot)
+    Dispatcher.set_current(dispatcher)
+    while True:
+        update = await update_queue.get()
+        try:
+            await dispatcher.process_update(update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+        finally:
+            update_queue.task_done()
+
+
+async def _start_queue(dispatcher):
+    global update_queue
+    update_queue = asyncio.Queue(maxsize=config.WEBHOOK_QUEUE_SIZE)
+    for _ in range(config.WEBHOOK_QUEUE_WORKERS):
+        _workers.append(asyncio.create_task(_queue_worker(dispatcher)))
+    logger.info(f"Очередь обновлений: размер {config.WEBHOOK_QUEUE_SIZE}, обработчиков {config.WEBHOOK_QUEUE_WORKERS}")
+
+
+async def _stop_queue(dispatcher):
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def register_webhook(dispatcher):
+    """Регистрирует webhook в Telegram, если задан публичный адрес"""
+    if not config.WEBHOOK_HOST:
+        logger.info("WEBHOOK_HOST не задан, webhook в Telegram не регистрируется (локальный режим)")
+        return
+
+    url = config.WEBHOOK_HOST.rstrip("/") + config.WEBHOOK_PATH
+    await dispatcher.bot.set_webhook(
+        url,
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        secret_token=config.WEBHOOK_SECRET or None,
+        drop_pending_updates=True
+    )
+    logger.info(f"Webhook зарегистрирован: {url}")
+
+
+def start_webhook(dispatcher, on_startup=None, on_shutdown=None, register=True, **app_kwargs):
+    """
+    Запускает бота в режиме webhook на WEBAPP_HOST:WEBAPP_PORT
+
+    Args:
+        dispatcher: диспетчер aiogram
+        on_startup: функция, вызываемая при запуске (как в start_polling)
+        on_shutdown: функция, вызываемая при остановке
+        register: регистрировать ли webhook в Telegram (в кластере это делает процесс обновления)
+        **app_kwargs: дополнительные параметры aiohttp.web.run_app
+    """
+    executor = Executor(dispatcher)
+    if config.WEBHOOK_QUEUE_SIZE > 0:
+        executor.on_startup(_start_queue)
+        executor.on_shutdown(_stop_queue)
+    if on_startup is not None:
+        executor.on_startup(on_startup)
+    if register:
+        executor.on_startup(register_webhook)
+    if on_shutdown is not None:
+        executor.on_shutdown(on_shutdown)
+
+    executor.set_webhook(webhook_path=config.WEBHOOK_PATH, request_handler=SecretWebhookRequestHandler)
+    logger.info(f"Webhook-сервер слушает {config.WEBAPP_HOST}:{config.WEBAPP_PORT}{config.WEBHOOK_PATH}")
+    executor.run_app(host=config.WEBAPP_HOST, port=config.WEBAPP_PORT, **app_kwargs)